@@ -8,8 +8,11 @@ from routers import (
     grading,
     profile,
     dashboard,
+    ocr,
 )
 from core.db import create_tables
+from services.grading_tunneling import init_http_client, close_http_client
+from services.grading_queue import start_grading_workers, stop_grading_workers
 
 app = FastAPI(
     title="Grade Mind",
@@ -32,12 +35,14 @@ app.include_router(dashboard.router, tags=["dashboard"])
 app.include_router(classes.router, tags=["classes"])
 app.include_router(assignments.router, tags=["assignments"])
 app.include_router(grading.router, tags=["grading"])
-# app.include_router(ocr.router, tags=["ocr"])
+app.include_router(ocr.router, tags=["ocr"])
 
 @app.on_event("startup")
 async def on_startup():
     await create_tables()
     print("Database tables created successfully")
+    await init_http_client()
+    await start_grading_workers()
     # NOTE: Uncomment kalo AI sudah full implemented
     # from services.grading_service import initialize_embedding_model
     # try:
@@ -45,6 +50,11 @@ async def on_startup():
     # except Exception as e:
     #     print(f"Warning: Failed to initialize embedding model: {e}")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_grading_workers()
+    await close_http_client()
+
 @app.get("/")
 async def root():
     return {"message": "FastAPI berhasil dijalankan dengan Uvicorn!"}
\ No newline at end of file
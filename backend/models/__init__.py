@@ -6,6 +6,7 @@ from models.question import Question
 from models.assignment_submission import AssignmentSubmission, SubmissionType
 from models.question_answer import QuestionAnswer
 from models.nilai import Nilai
+from models.grading_job import GradingJob, GradingJobStatus
 
 __all__ = [
     "User",
@@ -19,5 +20,7 @@ __all__ = [
     "SubmissionType",
     "QuestionAnswer",
     "Nilai",
+    "GradingJob",
+    "GradingJobStatus",
 ]
 
@@ -16,6 +16,9 @@ class AssignmentSubmission(Base):
     student_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     submission_type = Column(SQLEnum(SubmissionType), nullable=False)
     file_path = Column(String, nullable=True)
+    # Job di service OCR yang sedang membaca file; dikosongkan bila OCR gagal agar dikirim ulang
+    ocr_job_id = Column(String(64), nullable=True)
+    ocr_requested_at = Column(DateTime, nullable=True)
     submitted_at = Column(DateTime, default=datetime.utcnow)
 
     assignment = relationship("Assignment", back_populates="submissions")
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import enum
+from models.user_model import Base
+
+class GradingJobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class GradingJob(Base):
+    __tablename__ = "grading_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), nullable=False)
+    submission_id = Column(Integer, ForeignKey("assignment_submissions.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(SQLEnum(GradingJobStatus), nullable=False, default=GradingJobStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Lease: worker yang sedang menjalankan job dan heartbeat terakhirnya
+    worker_id = Column(String(100), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    # Job pending baru boleh diambil setelah waktu ini (backoff retry)
+    run_after = Column(DateTime, nullable=True)
+
+    assignment = relationship("Assignment")
+    submission = relationship("AssignmentSubmission")
+
+    __table_args__ = (Index("ix_grading_jobs_assignment_status", "assignment_id", "status"),)
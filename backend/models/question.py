@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
 from sqlalchemy.orm import relationship
+from datetime import datetime
 from models.user_model import Base
 
 class Question(Base):
@@ -11,6 +12,13 @@ class Question(Base):
     reference_answer = Column(Text, nullable=False)
     question_order = Column(Integer, nullable=False)
     points = Column(Integer, default=10)
+    # "code" atau "essay" dari grader (/embed); NULL sampai artefak soal dihitung grader
+    prompt_type = Column(String(20), nullable=True)
+    # Artefak dari grader: {"model": ..., "vector": [...]} dan versi template prompt; dikosongkan saat soal diubah
+    answer_key_embedding = Column(JSON, nullable=True)
+    prompt_version = Column(String(20), nullable=True)
+    # Waktu terakhir isi soal yang memengaruhi nilai (teks, kunci jawaban, poin) berubah
+    content_updated_at = Column(DateTime, default=datetime.utcnow)
 
     assignment = relationship("Assignment", back_populates="questions")
     question_answers = relationship("QuestionAnswer", back_populates="question", cascade="all, delete-orphan")
\ No newline at end of file
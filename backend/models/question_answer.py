@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Text, JSON
 from sqlalchemy.orm import relationship
 from models.user_model import Base
 
@@ -19,6 +19,8 @@ class QuestionAnswer(Base):
     embedding_similarity = Column(Float, nullable=True)
     llm_time = Column(Float, nullable=True)
     similarity_time = Column(Float, nullable=True)
+    # Jalur yang menilai jawaban: "llm" atau alasan fast path ("empty", "duplicate", "low_similarity")
+    graded_by = Column(String(20), nullable=True)
 
     submission = relationship("AssignmentSubmission", back_populates="question_answers")
     question = relationship("Question", back_populates="question_answers")
\ No newline at end of file
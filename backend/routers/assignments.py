@@ -15,9 +15,9 @@ from models.question import Question
 from models.assignment_submission import AssignmentSubmission, SubmissionType
 from models.question_answer import QuestionAnswer
 from models.class_participant import ClassParticipant
-from models.nilai import Nilai
-# from services.ocr_service import process_uploaded_file
-from services.grading_tunneling import grade_submission_batch_via_tunnel
+from services.ocr_service import save_ocr_upload, MAX_FILE_SIZE
+from services.grading_queue import enqueue_grading_jobs, get_submission_grading_status, GRADING_PENDING
+from services.question_metadata import invalidate_question_artifacts, refresh_question_artifacts
 
 router = APIRouter(prefix="/api/assignments", tags=["assignments"])
 
@@ -32,6 +32,7 @@ class QuestionRead(BaseModel):
     reference_answer: str
     question_order: int
     points: int
+    prompt_type: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -141,6 +142,7 @@ async def create_assignment(
     db.add(new_assignment)
     await db.flush()
 
+    questions = []
     for idx, question_data in enumerate(request.questions):
         question = Question(
             assignment_id=new_assignment.id,
@@ -150,8 +152,12 @@ async def create_assignment(
             question_order=idx + 1
         )
         db.add(question)
+        questions.append(question)
 
     await db.commit()
+    # Artefak dihitung setelah commit agar tugas tetap tersimpan walau grader lambat atau mati
+    if await refresh_question_artifacts(questions):
+        await db.commit()
     await db.refresh(new_assignment, ["questions"])
 
     return AssignmentResponse(
@@ -316,6 +322,8 @@ async def update_assignment(
     if request.is_published is not None:
         assignment.is_published = request.is_published # type: ignore
 
+    # Soal baru atau yang kunci jawabannya berubah perlu artefak baru
+    changed_questions = []
     if request.questions is not None:
         existing_question_ids = {q.id for q in assignment.questions}
         updated_question_ids = {q.id for q in request.questions if q.id is not None}
@@ -325,6 +333,11 @@ async def update_assignment(
             await db.execute(
                 delete(Question).where(Question.id.in_(questions_to_delete))
             )
+            # Total dan max_score Nilai lama ikut berubah: tandai soal yang tersisa agar dinilai ulang
+            deleted_at = datetime.utcnow()
+            for question in assignment.questions:
+                if question.id not in questions_to_delete:
+                    question.content_updated_at = deleted_at # type: ignore
 
         for idx, question_update in enumerate(request.questions):
             if question_update.id is not None:
@@ -333,12 +346,20 @@ async def update_assignment(
                 )
                 existing_question = result.scalar_one_or_none()
                 if existing_question:
-                    if question_update.question_text is not None:
+                    content_changed = False
+                    if question_update.question_text is not None and question_update.question_text != existing_question.question_text:
                         existing_question.question_text = question_update.question_text # type: ignore
-                    if question_update.reference_answer is not None:
+                        content_changed = True
+                    if question_update.reference_answer is not None and question_update.reference_answer != existing_question.reference_answer:
                         existing_question.reference_answer = question_update.reference_answer # type: ignore
-                    if question_update.points is not None:
+                        invalidate_question_artifacts(existing_question)
+                        changed_questions.append(existing_question)
+                        content_changed = True
+                    if question_update.points is not None and question_update.points != existing_question.points:
                         existing_question.points = question_update.points # type: ignore
+                        content_changed = True
+                    if content_changed:
+                        existing_question.content_updated_at = datetime.utcnow() # type: ignore
                     existing_question.question_order = idx + 1 # type: ignore
             else:
                 if question_update.question_text and question_update.reference_answer:
@@ -350,8 +371,11 @@ async def update_assignment(
                         question_order=idx + 1
                     )
                     db.add(new_question)
+                    changed_questions.append(new_question)
 
     await db.commit()
+    if await refresh_question_artifacts(changed_questions):
+        await db.commit()
     await db.refresh(assignment, ["questions"])
 
     return AssignmentResponse(
@@ -462,138 +486,92 @@ async def submit_answer_typing(
         )
         db.add(question_answer)
 
-    await db.commit()
-    await db.refresh(submission, ["question_answers"])
-
-    # Grade submission using AI tunnel
-    try:
-        submission_data = {
-            "assignment_info": {
-                "title": assignment.title,
-                "description": assignment.description or ""
-            },
-            "questions": [
-                {
-                    "question_id": q.id,
-                    "question_text": q.question_text,
-                    "reference_answer": q.reference_answer,
-                    "points": q.points
-                }
-                for q in assignment.questions
-            ],
-            "answers": [
-                {
-                    "question_id": qa.question_id,
-                    "answer_text": qa.answer_text
-                }
-                for qa in submission.question_answers
-            ]
-        }
-
-        grading_result = await grade_submission_batch_via_tunnel(submission_data)
-
-        for result_item in grading_result["results"]:
-            question_answer = next(
-                (qa for qa in submission.question_answers if qa.question_id == result_item["question_id"]),
-                None
-            )
+    # Submission, jawaban, dan job penilaian di-commit bersama; penilaian berjalan di worker
+    queue_result = await enqueue_grading_jobs(db, assignment_id, [submission.id]) # type: ignore
 
-            if question_answer:
-                question_answer.final_score = result_item["final_score"]
-                question_answer.feedback = result_item["feedback"]
-                question_answer.rubric_pemahaman = result_item["rubric_scores"]["pemahaman"]
-                question_answer.rubric_kelengkapan = result_item["rubric_scores"]["kelengkapan"]
-                question_answer.rubric_kejelasan = result_item["rubric_scores"]["kejelasan"]
-                question_answer.rubric_analisis = result_item["rubric_scores"]["analisis"]
-                question_answer.rubric_rata_rata = result_item["rubric_scores"]["rata_rata"]
-                question_answer.embedding_similarity = result_item["embedding_similarity"]
-                question_answer.llm_time = result_item["llm_time"]
-                question_answer.similarity_time = result_item["similarity_time"]
-
-        nilai = Nilai(
-            submission_id=submission.id,
-            total_score=grading_result["total_score"],
-            max_score=grading_result["total_points"],
-            percentage=grading_result["percentage"],
-            avg_pemahaman=grading_result["aggregate_rubrics"]["pemahaman"],
-            avg_kelengkapan=grading_result["aggregate_rubrics"]["kelengkapan"],
-            avg_kejelasan=grading_result["aggregate_rubrics"]["kejelasan"],
-            avg_analisis=grading_result["aggregate_rubrics"]["analisis"],
-            avg_embedding_similarity=grading_result["aggregate_rubrics"]["avg_embedding_similarity"],
-            total_llm_time=grading_result["total_llm_time"],
-            total_similarity_time=grading_result["total_similarity_time"]
+    return {
+        "message": "Jawaban berhasil dikumpulkan, penilaian sedang diproses",
+        "submission_id": submission.id,
+        "grading_status": GRADING_PENDING,
+        "job_id": queue_result["job_ids"][0] if queue_result["job_ids"] else None
+    }
+
+@router.post("/{assignment_id}/submit/ocr", status_code=status.HTTP_201_CREATED)
+async def submit_answer_ocr(
+    assignment_id: int,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    result = await db.execute(
+        select(Assignment)
+        .options(selectinload(Assignment.kelas), selectinload(Assignment.questions))
+        .where(Assignment.id == assignment_id)
+    )
+    assignment = result.scalar_one_or_none()
+
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
+
+    if not assignment.is_published: # type: ignore
+        raise HTTPException(status_code=403, detail="Tugas belum diterbitkan")
+
+    result = await db.execute(
+        select(ClassParticipant).where(
+            ClassParticipant.kelas_id == assignment.kelas_id,
+            ClassParticipant.user_id == current_user.id
         )
-        db.add(nilai)
-        await db.commit()
+    )
+    is_participant = result.scalar_one_or_none() is not None
+
+    if not is_participant:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk mengumpulkan tugas di kelas ini")
 
-        return {
-            "message": "Answer submitted and graded successfully via AI tunnel",
-            "submission_id": submission.id,
-            "total_score": nilai.total_score,
-            "max_score": nilai.max_score,
-            "percentage": nilai.percentage
-        }
-    except Exception as e:
-        print(f"Auto-grading failed: {str(e)}")
-        await db.commit()  # Commit the submission even if grading fails
-        return {
-            "message": f"Answer submitted successfully (grading failed: {str(e)})",
-            "submission_id": submission.id
-        }
-
-# @router.post("/{assignment_id}/submit/ocr", status_code=status.HTTP_201_CREATED)
-# async def submit_answer_ocr(
-#     assignment_id: int,
-#     file: UploadFile = File(...),
-#     current_user: User = Depends(get_current_user),
-#     db: AsyncSession = Depends(get_session)
-# ):
-#     result = await db.execute(
-#         select(Assignment)
-#         .options(selectinload(Assignment.kelas), selectinload(Assignment.questions))
-#         .where(Assignment.id == assignment_id)
-#     )
-#     assignment = result.scalar_one_or_none()
-
-#     if not assignment:
-#         raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
-
-#     if not assignment.is_published:
-#         raise HTTPException(status_code=403, detail="Tugas belum diterbitkan")
-
-#     result = await db.execute(
-#         select(ClassParticipant).where(
-#             ClassParticipant.kelas_id == assignment.kelas_id,
-#             ClassParticipant.user_id == current_user.id
-#         )
-#     )
-#     is_participant = result.scalar_one_or_none() is not None
-
-#     if not is_participant:
-#         raise HTTPException(status_code=403, detail="Tidak punya permission untuk mengumpulkan tugas di kelas ini")
-
-#     if assignment.deadline and datetime.utcnow() > assignment.deadline:
-#         raise HTTPException(status_code=400, detail="Batas waktu pengumpulan tugas sudah lewat")
-
-#     result = await db.execute(
-#         select(AssignmentSubmission).where(
-#             AssignmentSubmission.assignment_id == assignment_id,
-#             AssignmentSubmission.student_id == current_user.id
-#         )
-#     )
-#     existing_submission = result.scalar_one_or_none()
-
-#     if existing_submission:
-#         raise HTTPException(status_code=400, detail="Anda sudah mengumpulkan tugas ini")
-
-#     extracted_text = await process_uploaded_file(file)
-
-#     return {
-#         "message": "File processed successfully",
-#         "extracted_text": extracted_text,
-#         "questions": [QuestionRead.model_validate(q) for q in assignment.questions],
-#         "note": "Silakan review teks yang diambil dan kirimkan jawaban menggunakan endpoint typing"
-#     }
+    if assignment.deadline and datetime.utcnow() > assignment.deadline: # type: ignore
+        raise HTTPException(status_code=400, detail="Batas waktu pengumpulan tugas sudah lewat")
+
+    result = await db.execute(
+        select(AssignmentSubmission).where(
+            AssignmentSubmission.assignment_id == assignment_id,
+            AssignmentSubmission.student_id == current_user.id
+        )
+    )
+    existing_submission = result.scalar_one_or_none()
+
+    if existing_submission:
+        raise HTTPException(status_code=400, detail="Anda sudah mengumpulkan tugas ini")
+
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Hanya file PDF yang diizinkan")
+
+    content = await file.read()
+    if len(content) > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ukuran file melebihi batas 50MB. File Anda adalah {len(content) / (1024*1024):.2f}MB"
+        )
+
+    file_path = save_ocr_upload(content, assignment_id, current_user.id, file.filename) # type: ignore
+
+    submission = AssignmentSubmission(
+        assignment_id=assignment_id,
+        student_id=current_user.id,
+        submission_type=SubmissionType.OCR,
+        file_path=file_path
+    )
+
+    db.add(submission)
+    await db.flush()
+
+    # OCR dan penilaian berjalan di worker: jawaban diisi dari hasil service OCR lalu dinilai
+    queue_result = await enqueue_grading_jobs(db, assignment_id, [submission.id]) # type: ignore
+
+    return {
+        "message": "File berhasil dikumpulkan, OCR dan penilaian sedang diproses",
+        "submission_id": submission.id,
+        "grading_status": GRADING_PENDING,
+        "job_id": queue_result["job_ids"][0] if queue_result["job_ids"] else None
+    }
 
 @router.get("/{assignment_id}/submissions", response_model=List[SubmissionResponse])
 async def get_assignment_submissions(
@@ -659,9 +637,12 @@ async def get_my_submission(
     if not submission:
         return {"submitted": False}
 
+    grading = await get_submission_grading_status(db, submission.id) # type: ignore
+
     return {
         "submitted": True,
         "submission_id": submission.id,
+        "grading_status": grading["grading_status"],
         "submission_type": submission.submission_type.value,
         "submitted_at": submission.submitted_at,
         "answers": [
@@ -690,4 +671,23 @@ async def get_my_submission(
         "avg_analisis": submission.nilai.avg_analisis if submission.nilai else None,
         "avg_embedding_similarity": submission.nilai.avg_embedding_similarity if submission.nilai else None,
         "graded_at": submission.nilai.graded_at if submission.nilai else None
-    }
\ No newline at end of file
+    }
+
+@router.get("/{assignment_id}/my-submission/grading-status")
+async def get_my_grading_status(
+    assignment_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    result = await db.execute(
+        select(AssignmentSubmission.id).where(
+            AssignmentSubmission.assignment_id == assignment_id,
+            AssignmentSubmission.student_id == current_user.id
+        )
+    )
+    submission_id = result.scalar_one_or_none()
+
+    if submission_id is None:
+        raise HTTPException(status_code=404, detail="Submission tidak ditemukan")
+
+    return await get_submission_grading_status(db, submission_id)
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-from core.db import get_session
+import asyncio
+from core.db import SessionLocal, get_session
 from core.auth import get_current_user, get_current_dosen
 from models.user_model import User
 from models.assignment import Assignment
@@ -14,7 +16,14 @@ from models.assignment_submission import AssignmentSubmission
 from models.question_answer import QuestionAnswer
 from models.nilai import Nilai
 from models.class_participant import ClassParticipant
-from services.grading_tunneling import grade_submission_batch_via_tunnel
+from models.grading_job import GradingJob
+from services.grading_tunneling import IncompleteGradingError
+from services.grading_queue import (
+    enqueue_grading_jobs, get_assignment_progress, find_submissions_to_grade, count_submissions, grade_and_store_submission
+)
+from services.ocr_service import OCRPendingError
+from services.question_metadata import refresh_question_artifacts
+from services.grading_events import grading_events, format_sse, KEEPALIVE_INTERVAL
 
 router = APIRouter(prefix="/api/grading", tags=["grading"])
 class GradeSubmissionRequest(BaseModel):
@@ -85,6 +94,16 @@ class SubmissionDetailResponse(BaseModel):
     avg_embedding_similarity: Optional[float]
     graded_at: Optional[datetime]
     question_details: List[QuestionGradeDetail]
+class GradingJobResponse(BaseModel):
+    id: int
+    assignment_id: int
+    submission_id: int
+    status: str
+    attempts: int
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
 
 @router.post("/submissions/{submission_id}/grade", status_code=status.HTTP_201_CREATED)
 async def grade_submission(
@@ -150,14 +169,7 @@ async def auto_grade_submission(
 ):
     result = await db.execute(
         select(AssignmentSubmission)
-        .options(
-            selectinload(AssignmentSubmission.assignment)
-                .selectinload(Assignment.kelas),
-            selectinload(AssignmentSubmission.assignment)
-                .selectinload(Assignment.questions),
-            selectinload(AssignmentSubmission.question_answers)
-                .selectinload(QuestionAnswer.question)
-        )
+        .options(selectinload(AssignmentSubmission.assignment).selectinload(Assignment.kelas))
         .where(AssignmentSubmission.id == submission_id)
     )
     submission = result.scalar_one_or_none()
@@ -168,92 +180,20 @@ async def auto_grade_submission(
     if submission.assignment.kelas.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Tidak punya permission untuk menilai submission tugas di kelas ini")
     
-    # Prepare submission data for AI grading
-    submission_data = {
-        "assignment_info": {
-            "title": submission.assignment.title,
-            "description": submission.assignment.description or ""
-        },
-        "questions": [
-            {
-                "question_id": q.id,
-                "question_text": q.question_text,
-                "reference_answer": q.reference_answer,
-                "points": q.points
-            }
-            for q in submission.assignment.questions
-        ],
-        "answers": [
-            {
-                "question_id": qa.question_id,
-                "answer_text": qa.answer_text
-            }
-            for qa in submission.question_answers
-        ]
-    }
-    
-    # Call AI tunnel for grading
+    # Jalur yang sama dengan worker antrian, termasuk ekstraksi jawaban submission OCR
     try:
-        grading_result = await grade_submission_batch_via_tunnel(submission_data)
+        nilai, grading_result = await grade_and_store_submission(db, submission_id)
+    except OCRPendingError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="File submission masih diproses OCR, coba lagi nanti")
+    except IncompleteGradingError as e:
+        # Hasil parsial tidak disimpan; submission tetap belum dinilai dan bisa dinilai ulang
+        await db.rollback()
+        raise HTTPException(status_code=502, detail=f"AI Grading Gagal: {str(e)}")
     except Exception as e:
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"AI Grading Gagal: {str(e)}")
-    
-    
-    for result_item in grading_result["results"]:
-        question_answer = next(
-            (qa for qa in submission.question_answers if qa.question_id == result_item["question_id"]),
-            None
-        )
-        
-        if question_answer:
-            question_answer.final_score = result_item["final_score"]
-            question_answer.feedback = result_item["feedback"]
-            question_answer.rubric_pemahaman = result_item["rubric_scores"]["pemahaman"]
-            question_answer.rubric_kelengkapan = result_item["rubric_scores"]["kelengkapan"]
-            question_answer.rubric_kejelasan = result_item["rubric_scores"]["kejelasan"]
-            question_answer.rubric_analisis = result_item["rubric_scores"]["analisis"]
-            question_answer.rubric_rata_rata = result_item["rubric_scores"]["rata_rata"]
-            question_answer.embedding_similarity = result_item["embedding_similarity"]
-            question_answer.llm_time = result_item["llm_time"]
-            question_answer.similarity_time = result_item["similarity_time"]
-    
-    result = await db.execute(
-        select(Nilai).where(Nilai.submission_id == submission_id)
-    )
-    existing_nilai = result.scalar_one_or_none()
-    
-    if existing_nilai:
-        existing_nilai.total_score = grading_result["total_score"]
-        existing_nilai.max_score = grading_result["total_points"]
-        existing_nilai.percentage = grading_result["percentage"]
-        existing_nilai.avg_pemahaman = grading_result["aggregate_rubrics"]["pemahaman"]
-        existing_nilai.avg_kelengkapan = grading_result["aggregate_rubrics"]["kelengkapan"]
-        existing_nilai.avg_kejelasan = grading_result["aggregate_rubrics"]["kejelasan"]
-        existing_nilai.avg_analisis = grading_result["aggregate_rubrics"]["analisis"]
-        existing_nilai.avg_embedding_similarity = grading_result["aggregate_rubrics"]["avg_embedding_similarity"]
-        existing_nilai.total_llm_time = grading_result["total_llm_time"]
-        existing_nilai.total_similarity_time = grading_result["total_similarity_time"]
-        existing_nilai.graded_at = datetime.utcnow() # type: ignore
-        await db.commit()
-        await db.refresh(existing_nilai)
-        nilai = existing_nilai
-    else:
-        nilai = Nilai(
-            submission_id=submission_id,
-            total_score=grading_result["total_score"],
-            max_score=grading_result["total_points"],
-            percentage=grading_result["percentage"],
-            avg_pemahaman=grading_result["aggregate_rubrics"]["pemahaman"],
-            avg_kelengkapan=grading_result["aggregate_rubrics"]["kelengkapan"],
-            avg_kejelasan=grading_result["aggregate_rubrics"]["kejelasan"],
-            avg_analisis=grading_result["aggregate_rubrics"]["analisis"],
-            avg_embedding_similarity=grading_result["aggregate_rubrics"]["avg_embedding_similarity"],
-            total_llm_time=grading_result["total_llm_time"],
-            total_similarity_time=grading_result["total_similarity_time"]
-        )
-        db.add(nilai)
-        await db.commit()
-        await db.refresh(nilai)
+    await db.commit()
     
     return {
         "message": "Submission auto-graded successfully via AI tunnel",
@@ -266,18 +206,16 @@ async def auto_grade_submission(
         "total_similarity_time": grading_result["total_similarity_time"]
     }
 
-@router.post("/assignments/{assignment_id}/auto-grade-all", status_code=status.HTTP_200_OK)
+@router.post("/assignments/{assignment_id}/auto-grade-all", status_code=status.HTTP_202_ACCEPTED)
 async def auto_grade_all_submissions(
     assignment_id: int,
+    force: bool = False,
     current_user: User = Depends(get_current_dosen),
     db: AsyncSession = Depends(get_session)
 ):
     result = await db.execute(
         select(Assignment)
-        .options(
-            selectinload(Assignment.kelas),
-            selectinload(Assignment.questions)
-        )
+        .options(selectinload(Assignment.kelas), selectinload(Assignment.questions))
         .where(Assignment.id == assignment_id)
     )
     assignment = result.scalar_one_or_none()
@@ -288,120 +226,148 @@ async def auto_grade_all_submissions(
     if assignment.kelas.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Tidak punya permission untuk menilai semua submission tugas di kelas ini")
     
-    result = await db.execute(
-        select(AssignmentSubmission)
-        .options(
-            selectinload(AssignmentSubmission.nilai),
-            selectinload(AssignmentSubmission.question_answers)
-        )
-        .where(AssignmentSubmission.assignment_id == assignment_id)
+    # Soal tanpa artefak atau dengan artefak dari model/versi prompt lama dihitung ulang.
+    # Di-commit sendiri: enqueue tidak commit bila semua submission sudah dinilai
+    if await refresh_question_artifacts(assignment.questions):
+        await db.commit()
+    
+    # Hanya submission tanpa Nilai atau yang berubah sejak graded_at dinilai ulang, kecuali force=true
+    questions_changed_at = max(
+        (q.content_updated_at for q in assignment.questions if q.content_updated_at is not None),
+        default=None
     )
-    submissions = result.scalars().all()
+    total_submissions = await count_submissions(db, assignment_id)
+    submission_ids = await find_submissions_to_grade(db, assignment_id, questions_changed_at, force=force)
+    
+    # Setiap submission menjadi satu job; hasil di-commit oleh worker per submission
+    queue_result = await enqueue_grading_jobs(db, assignment_id, submission_ids)
+    print(f"Enqueued {queue_result['queued']} grading job(s) for assignment {assignment_id}")
     
-    graded_count = 0
-    failed_count = 0
+    return {
+        "message": f"{queue_result['queued']} submission masuk antrian penilaian, {queue_result['already_queued']} sudah dalam antrian, {total_submissions - len(submission_ids)} sudah dinilai.",
+        "total_submissions": total_submissions,
+        "up_to_date": total_submissions - len(submission_ids),
+        "queued": queue_result["queued"],
+        "already_queued": queue_result["already_queued"],
+        "job_ids": queue_result["job_ids"]
+    }
 
-    print(f"Starting auto-grading for {len(submissions)} submissions...")
+@router.get("/assignments/{assignment_id}/auto-grade-all/status")
+async def get_auto_grade_all_status(
+    assignment_id: int,
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    result = await db.execute(
+        select(Assignment)
+        .options(selectinload(Assignment.kelas))
+        .where(Assignment.id == assignment_id)
+    )
+    assignment = result.scalar_one_or_none()
     
-    for submission in submissions:
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
+    
+    if assignment.kelas.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk melihat progres penilaian tugas di kelas ini")
+    
+    return await get_assignment_progress(db, assignment_id)
 
-        print(f"Processing submission before IF {submission.id}...")
-        if submission.nilai != 0.0 or submission.nilai is None: 
-            submission_data = {
-                "assignment_info": {
-                    "title": assignment.title,
-                    "description": assignment.description or ""
-                },
-                "questions": [
-                    {
-                        "question_id": q.id,
-                        "question_text": q.question_text,
-                        "reference_answer": q.reference_answer,
-                        "points": q.points
-                    }
-                    for q in assignment.questions
-                ],
-                "answers": [
-                    {
-                        "question_id": qa.question_id,
-                        "answer_text": qa.answer_text
-                    }
-                    for qa in submission.question_answers
-                ]
-            }
-            
-            try:
-                print(f"Auto-grading submission {submission.id}...")
-                grading_result = await grade_submission_batch_via_tunnel(submission_data)
-                
-                for result_item in grading_result["results"]:
-                    question_answer = next(
-                        (qa for qa in submission.question_answers if qa.question_id == result_item["question_id"]),
-                        None
-                    )
-                    
-                    if question_answer:
-                        question_answer.final_score = result_item["final_score"]
-                        question_answer.feedback = result_item["feedback"]
-                        question_answer.rubric_pemahaman = result_item["rubric_scores"]["pemahaman"]
-                        question_answer.rubric_kelengkapan = result_item["rubric_scores"]["kelengkapan"]
-                        question_answer.rubric_kejelasan = result_item["rubric_scores"]["kejelasan"]
-                        question_answer.rubric_analisis = result_item["rubric_scores"]["analisis"]
-                        question_answer.rubric_rata_rata = result_item["rubric_scores"]["rata_rata"]
-                        question_answer.embedding_similarity = result_item["embedding_similarity"]
-                        question_answer.llm_time = result_item["llm_time"]
-                        question_answer.similarity_time = result_item["similarity_time"]
-                
-                # Check if Nilai already exists for this submission
-                nilai_result = await db.execute(
-                    select(Nilai).where(Nilai.submission_id == submission.id)
-                )
-                existing_nilai = nilai_result.scalar_one_or_none()
-                
-                if existing_nilai:
-                    # Update existing Nilai with new scores
-                    existing_nilai.total_score = grading_result["total_score"]
-                    existing_nilai.max_score = grading_result["total_points"]
-                    existing_nilai.percentage = grading_result["percentage"]
-                    existing_nilai.avg_pemahaman = grading_result["aggregate_rubrics"]["pemahaman"]
-                    existing_nilai.avg_kelengkapan = grading_result["aggregate_rubrics"]["kelengkapan"]
-                    existing_nilai.avg_kejelasan = grading_result["aggregate_rubrics"]["kejelasan"]
-                    existing_nilai.avg_analisis = grading_result["aggregate_rubrics"]["analisis"]
-                    existing_nilai.avg_embedding_similarity = grading_result["aggregate_rubrics"]["avg_embedding_similarity"]
-                    existing_nilai.total_llm_time = grading_result["total_llm_time"]
-                    existing_nilai.total_similarity_time = grading_result["total_similarity_time"]
-                    existing_nilai.graded_at = datetime.utcnow() # type: ignore
-                else:
-                    # Create new Nilai
-                    nilai = Nilai(
-                        submission_id=submission.id,
-                        total_score=grading_result["total_score"],
-                        max_score=grading_result["total_points"],
-                        percentage=grading_result["percentage"],
-                        avg_pemahaman=grading_result["aggregate_rubrics"]["pemahaman"],
-                        avg_kelengkapan=grading_result["aggregate_rubrics"]["kelengkapan"],
-                        avg_kejelasan=grading_result["aggregate_rubrics"]["kejelasan"],
-                        avg_analisis=grading_result["aggregate_rubrics"]["analisis"],
-                        avg_embedding_similarity=grading_result["aggregate_rubrics"]["avg_embedding_similarity"],
-                        total_llm_time=grading_result["total_llm_time"],
-                        total_similarity_time=grading_result["total_similarity_time"]
-                    )
-                    db.add(nilai)
-                
-                graded_count += 1
-            except Exception as e:
-                print(f"Gagal meng-graded submission {submission.id}: {str(e)}")
-                failed_count += 1
-                continue
+@router.get("/assignments/{assignment_id}/auto-grade-all/stream")
+async def stream_auto_grade_all_progress(
+    assignment_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Server-sent events progres penilaian: submission_started, question_graded (dengan llm_time dan
+    similarity_time), submission_graded, submission_failed, serta snapshot progress. Stream ditutup
+    dengan event done setelah tidak ada lagi job yang pending/running (langsung setelah snapshot
+    awal bila antrian sudah kosong).
+
+    Endpoint ini butuh header Authorization: Bearer seperti endpoint lain, sedangkan EventSource
+    di browser tidak bisa mengirim header. Klien harus membaca stream lewat fetch() dengan header
+    Authorization dan memproses response.body sebagai text/event-stream.
+    """
+    result = await db.execute(
+        select(Assignment)
+        .options(selectinload(Assignment.kelas))
+        .where(Assignment.id == assignment_id)
+    )
+    assignment = result.scalar_one_or_none()
     
-    await db.commit()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
     
-    return {
-        "message": f"Auto-graded {graded_count} berhasil submission(s), {failed_count} gagal.",
-        "total_submissions": len(submissions),
-        "newly_graded": graded_count,
-        "failed": failed_count
-    }
+    if assignment.kelas.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk melihat progres penilaian tugas di kelas ini")
+    
+    async def load_progress():
+        # Session request sudah ditutup saat stream berjalan, jadi pakai session sendiri
+        async with SessionLocal() as session: # type: ignore
+            return await get_assignment_progress(session, assignment_id)
+    
+    async def event_stream():
+        # Subscribe sebelum snapshot agar tidak ada event yang terlewat di antaranya
+        queue = grading_events.subscribe(assignment_id)
+        try:
+            progress = await load_progress()
+            yield format_sse("progress", progress)
+            if not progress["is_running"]:
+                yield format_sse("done", progress)
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield format_sse(event["event"], event)
+                # Snapshot progress dipublikasikan worker sekali per job, tidak di-query per subscriber
+                if event["event"] == "progress" and not event["is_running"]:
+                    yield format_sse("done", event)
+                    break
+        finally:
+            grading_events.unsubscribe(assignment_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}", response_model=GradingJobResponse)
+async def get_grading_job(
+    job_id: int,
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    result = await db.execute(
+        select(GradingJob)
+        .options(selectinload(GradingJob.assignment).selectinload(Assignment.kelas))
+        .where(GradingJob.id == job_id)
+    )
+    job = result.scalar_one_or_none()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job penilaian tidak ditemukan")
+    
+    if job.assignment.kelas.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk melihat job penilaian ini")
+    
+    return GradingJobResponse(
+        id=job.id, # type: ignore
+        assignment_id=job.assignment_id, # type: ignore
+        submission_id=job.submission_id, # type: ignore
+        status=job.status.value,
+        attempts=job.attempts, # type: ignore
+        error=job.error, # type: ignore
+        created_at=job.created_at, # type: ignore
+        started_at=job.started_at, # type: ignore
+        finished_at=job.finished_at # type: ignore
+    )
 
 @router.get("/assignments/{assignment_id}/statistics", response_model=AssignmentStatisticsResponse)
 async def get_assignment_statistics(
@@ -0,0 +1,8 @@
+-- Migration: Add lease and retry backoff columns to grading_jobs
+-- Date: 2026-10-18
+-- Description: Tracks which worker owns a running grading job (worker_id, locked_at heartbeat)
+-- so only jobs with an expired lease are requeued, and delays retries with run_after
+
+ALTER TABLE grading_jobs ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100);
+ALTER TABLE grading_jobs ADD COLUMN IF NOT EXISTS locked_at TIMESTAMP WITHOUT TIME ZONE;
+ALTER TABLE grading_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP WITHOUT TIME ZONE;
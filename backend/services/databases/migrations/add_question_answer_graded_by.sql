@@ -0,0 +1,7 @@
+-- Migration: Add graded_by column to question_answers
+-- Date: 2026-10-18
+-- Description: Records whether an answer was scored by the LLM ("llm") or by the fast path
+-- ("empty", "duplicate", "low_similarity") so fast path statistics survive restarts
+
+-- Answers graded before this migration stay NULL and are left out of the statistics
+ALTER TABLE question_answers ADD COLUMN IF NOT EXISTS graded_by VARCHAR(20);
@@ -0,0 +1,11 @@
+-- Migration: Add precomputed grading artifact columns to questions
+-- Date: 2026-10-18
+-- Description: Stores the grader's answer key embedding ({"model", "vector"}), the prompt
+-- template version it was computed for, and when the question's graded content last changed
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS answer_key_embedding JSON;
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS prompt_version VARCHAR(20);
+
+-- Left NULL for existing questions so auto-grade-all does not regrade every submission;
+-- the backend sets it whenever question text, reference answer or points change
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS content_updated_at TIMESTAMP WITHOUT TIME ZONE;
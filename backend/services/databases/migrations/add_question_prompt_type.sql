@@ -0,0 +1,7 @@
+-- Migration: Add prompt_type column to questions
+-- Date: 2026-10-18
+-- Description: Stores whether a question is graded with the "code" or "essay" prompt template
+
+-- Existing rows stay NULL; the backend fills prompt_type the next time the question's
+-- grading artifacts are refreshed (on edit or on auto-grade-all)
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS prompt_type VARCHAR(20);
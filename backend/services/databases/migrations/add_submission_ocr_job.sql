@@ -0,0 +1,7 @@
+-- Migration: Add OCR job tracking columns to assignment_submissions
+-- Date: 2026-10-18
+-- Description: Remembers which OCR service job is reading an OCR submission's file so the
+-- grading worker can requeue the grading job instead of waiting for OCR to finish
+
+ALTER TABLE assignment_submissions ADD COLUMN IF NOT EXISTS ocr_job_id VARCHAR(64);
+ALTER TABLE assignment_submissions ADD COLUMN IF NOT EXISTS ocr_requested_at TIMESTAMP WITHOUT TIME ZONE;
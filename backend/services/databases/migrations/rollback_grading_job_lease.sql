@@ -0,0 +1,7 @@
+-- Rollback: Remove lease and retry backoff columns from grading_jobs
+-- Date: 2026-10-18
+-- Description: Drops the worker_id, locked_at and run_after columns from grading_jobs
+
+ALTER TABLE grading_jobs DROP COLUMN IF EXISTS run_after;
+ALTER TABLE grading_jobs DROP COLUMN IF EXISTS locked_at;
+ALTER TABLE grading_jobs DROP COLUMN IF EXISTS worker_id;
@@ -0,0 +1,5 @@
+-- Rollback: Remove graded_by column from question_answers
+-- Date: 2026-10-18
+-- Description: Drops the graded_by column from question_answers table
+
+ALTER TABLE question_answers DROP COLUMN IF EXISTS graded_by;
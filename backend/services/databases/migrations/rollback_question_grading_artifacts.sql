@@ -0,0 +1,7 @@
+-- Rollback: Remove precomputed grading artifact columns from questions
+-- Date: 2026-10-18
+-- Description: Drops answer_key_embedding, prompt_version and content_updated_at from questions
+
+ALTER TABLE questions DROP COLUMN IF EXISTS content_updated_at;
+ALTER TABLE questions DROP COLUMN IF EXISTS prompt_version;
+ALTER TABLE questions DROP COLUMN IF EXISTS answer_key_embedding;
@@ -0,0 +1,5 @@
+-- Rollback: Remove prompt_type column from questions
+-- Date: 2026-10-18
+-- Description: Drops the prompt_type column from questions table
+
+ALTER TABLE questions DROP COLUMN IF EXISTS prompt_type;
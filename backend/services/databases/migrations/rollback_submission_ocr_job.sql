@@ -0,0 +1,6 @@
+-- Rollback: Remove OCR job tracking columns from assignment_submissions
+-- Date: 2026-10-18
+-- Description: Drops the ocr_job_id and ocr_requested_at columns from assignment_submissions
+
+ALTER TABLE assignment_submissions DROP COLUMN IF EXISTS ocr_requested_at;
+ALTER TABLE assignment_submissions DROP COLUMN IF EXISTS ocr_job_id;
@@ -0,0 +1,48 @@
+from typing import Dict, Set
+from collections import defaultdict
+import asyncio
+import json
+import time
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Komentar SSE berkala agar proxy tidak menutup koneksi yang sedang menunggu
+KEEPALIVE_INTERVAL = 15
+
+
+class GradingEventBus:
+    """Pub/sub in-process untuk progres penilaian per assignment (satu proses backend)."""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, assignment_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[assignment_id].add(queue)
+        return queue
+
+    def unsubscribe(self, assignment_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(assignment_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[assignment_id]
+
+    def has_subscribers(self, assignment_id: int) -> bool:
+        return bool(self._subscribers.get(assignment_id))
+
+    def publish(self, assignment_id: int, event: str, data: Dict) -> None:
+        message = {"event": event, "assignment_id": assignment_id, "timestamp": time.time(), **data}
+        for queue in list(self._subscribers.get(assignment_id, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Klien yang terlalu lambat kehilangan event, penilaian tidak ikut tertahan
+                pass
+
+
+grading_events = GradingEventBus()
+
+
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,144 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import os
+import re
+import threading
+import time
+
+FAST_PATH_ENABLED = os.getenv("AI_FAST_PATH", "true").lower() == "true"
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+# Similarity (0-1) dengan kunci jawaban di atas nilai ini dianggap salinan kunci jawaban -> nilai penuh
+DUPLICATE_THRESHOLD = float(os.getenv("AI_FAST_PATH_DUPLICATE_THRESHOLD", "0.97"))
+# Similarity di bawah nilai ini langsung diberi nilai 0; 0 = nonaktif
+MIN_SIMILARITY = float(os.getenv("AI_FAST_PATH_MIN_SIMILARITY", "0"))
+REFERENCE_CACHE_SIZE = int(os.getenv("AI_FAST_PATH_CACHE_SIZE", "512"))
+# Nilai QuestionAnswer.graded_by untuk jawaban yang dinilai tanpa LLM
+FAST_PATH_REASONS = ("empty", "duplicate", "low_similarity")
+
+_model = None
+_model_failed = False
+_model_lock = threading.Lock()
+_reference_cache: "OrderedDict[str, object]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower()).strip(" .")
+
+
+def _load_model():
+    global _model, _model_failed
+    if _model is not None or _model_failed:
+        return _model
+    with _model_lock:
+        if _model is None and not _model_failed:
+            try:
+                from sentence_transformers import SentenceTransformer
+
+                start_load = time.time()
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+                print(f"✅ Model fast path {EMBEDDING_MODEL_NAME} siap ({round(time.time() - start_load, 2)} detik)")
+            except Exception as e:
+                # Tanpa model lokal, fast path tetap menangani jawaban kosong dan identik
+                _model_failed = True
+                print("=" * 72)
+                print(f"❌ Model fast path '{EMBEDDING_MODEL_NAME}' GAGAL dimuat: {e}")
+                print("❌ Cek EMBEDDING_MODEL_NAME di .env (contoh: sentence-transformers/all-MiniLM-L6-v2).")
+                print("❌ Sampai backend di-restart, fast path hanya menangani jawaban kosong/identik;")
+                print("❌ jawaban hampir identik dan tidak relevan tetap dikirim ke LLM.")
+                print("=" * 72)
+    return _model
+
+
+def _encode_reference(model, reference_answer: str):
+    with _cache_lock:
+        embedding = _reference_cache.get(reference_answer)
+        if embedding is not None:
+            _reference_cache.move_to_end(reference_answer)
+            return embedding
+    embedding = model.encode(reference_answer, convert_to_tensor=True, normalize_embeddings=True)
+    with _cache_lock:
+        _reference_cache[reference_answer] = embedding
+        while len(_reference_cache) > REFERENCE_CACHE_SIZE:
+            _reference_cache.popitem(last=False)
+    return embedding
+
+
+def _compute_similarities(pairs: List[Tuple[str, str]]) -> Optional[List[float]]:
+    model = _load_model()
+    if model is None:
+        return None
+    answers = model.encode([answer for answer, _ in pairs], convert_to_tensor=True, normalize_embeddings=True)
+    return [
+        float((_encode_reference(model, reference) * answer).sum())
+        for (_, reference), answer in zip(pairs, answers)
+    ]
+
+
+def _deterministic_result(
+    points: int, score: float, similarity: float, feedback: str, reason: str, similarity_time: float = 0.0
+) -> Dict:
+    return {
+        "final_score": round(score / 100 * points, 2),
+        "feedback": feedback,
+        "rubric_scores": {
+            "pemahaman": score,
+            "kelengkapan": score,
+            "kejelasan": score,
+            "analisis": score,
+            "rata_rata": score
+        },
+        "embedding_similarity": round(similarity * 100, 2),
+        "llm_time": 0.0,
+        "similarity_time": similarity_time,
+        # Disimpan ke QuestionAnswer.graded_by untuk statistik fast path
+        "graded_by": reason
+    }
+
+
+async def grade_fast_path(
+    questions: List[Dict],
+    student_answer_for: Callable[[int], str]
+) -> Dict[int, Dict]:
+    """
+    Nilai deterministik tanpa LLM untuk jawaban kosong, identik, atau hampir identik dengan kunci
+    jawaban (dan opsional jawaban yang sama sekali tidak mirip). Mengembalikan {question_id: hasil}.
+    """
+    if not FAST_PATH_ENABLED or not questions:
+        return {}
+
+    fast_results: Dict[int, Dict] = {}
+    candidates = []
+    for question in questions:
+        question_id = question["question_id"]
+        student_answer = student_answer_for(question_id)
+        if not _normalize(student_answer):
+            fast_results[question_id] = _deterministic_result(question["points"], 0.0, 0.0, "Jawaban kosong, tidak ada yang dapat dinilai.", "empty")
+        elif _normalize(student_answer) == _normalize(question["reference_answer"]):
+            fast_results[question_id] = _deterministic_result(question["points"], 100.0, 1.0, "Jawaban identik dengan kunci jawaban.", "duplicate")
+        else:
+            candidates.append((question, student_answer))
+
+    if candidates:
+        start_time = time.time()
+        try:
+            similarities = await asyncio.to_thread(
+                _compute_similarities, [(answer, question["reference_answer"]) for question, answer in candidates]
+            )
+        except Exception as e:
+            print(f"⚠️ Fast path similarity gagal, semua jawaban dinilai LLM: {e}")
+            similarities = None
+        similarity_time = round((time.time() - start_time) / len(candidates), 3)
+
+        for (question, _), similarity in zip(candidates, similarities or []):
+            if similarity >= DUPLICATE_THRESHOLD:
+                feedback = f"Jawaban hampir identik dengan kunci jawaban (kemiripan {round(similarity * 100, 2)}%)."
+                fast_results[question["question_id"]] = _deterministic_result(question["points"], 100.0, similarity, feedback, "duplicate", similarity_time)
+            elif similarity < MIN_SIMILARITY:
+                feedback = f"Jawaban tidak relevan dengan kunci jawaban (kemiripan {round(similarity * 100, 2)}%)."
+                fast_results[question["question_id"]] = _deterministic_result(question["points"], 0.0, max(0.0, similarity), feedback, "low_similarity", similarity_time)
+
+    if fast_results:
+        print(f"⚡ Fast path: {len(fast_results)}/{len(questions)} pertanyaan dinilai tanpa LLM")
+    return fast_results
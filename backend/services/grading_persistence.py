@@ -0,0 +1,119 @@
+from typing import Dict, Iterable, List, Tuple
+from datetime import datetime
+from sqlalchemy import Float, Integer, String, Text, column, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.nilai import Nilai
+from models.question_answer import QuestionAnswer
+
+ANSWER_RESULT_COLUMNS = (
+    ("final_score", Float),
+    ("feedback", Text),
+    ("rubric_pemahaman", Float),
+    ("rubric_kelengkapan", Float),
+    ("rubric_kejelasan", Float),
+    ("rubric_analisis", Float),
+    ("rubric_rata_rata", Float),
+    ("embedding_similarity", Float),
+    ("llm_time", Float),
+    ("similarity_time", Float),
+    ("graded_by", String),
+)
+
+NILAI_RESULT_COLUMNS = (
+    "total_score",
+    "max_score",
+    "percentage",
+    "avg_pemahaman",
+    "avg_kelengkapan",
+    "avg_kejelasan",
+    "avg_analisis",
+    "avg_embedding_similarity",
+    "total_llm_time",
+    "total_similarity_time",
+    "graded_at",
+)
+
+
+def _answer_rows(submission_id: int, grading_result: Dict) -> List[Tuple]:
+    return [
+        (
+            submission_id,
+            item["question_id"],
+            item["final_score"],
+            item["feedback"],
+            item["rubric_scores"]["pemahaman"],
+            item["rubric_scores"]["kelengkapan"],
+            item["rubric_scores"]["kejelasan"],
+            item["rubric_scores"]["analisis"],
+            item["rubric_scores"]["rata_rata"],
+            item["embedding_similarity"],
+            item["llm_time"],
+            item["similarity_time"],
+            item["graded_by"],
+        )
+        for item in grading_result["results"]
+    ]
+
+
+def _nilai_row(submission_id: int, grading_result: Dict, graded_at: datetime) -> Dict:
+    return {
+        "submission_id": submission_id,
+        "total_score": grading_result["total_score"],
+        "max_score": grading_result["total_points"],
+        "percentage": grading_result["percentage"],
+        "avg_pemahaman": grading_result["aggregate_rubrics"]["pemahaman"],
+        "avg_kelengkapan": grading_result["aggregate_rubrics"]["kelengkapan"],
+        "avg_kejelasan": grading_result["aggregate_rubrics"]["kejelasan"],
+        "avg_analisis": grading_result["aggregate_rubrics"]["analisis"],
+        "avg_embedding_similarity": grading_result["aggregate_rubrics"]["avg_embedding_similarity"],
+        "total_llm_time": grading_result["total_llm_time"],
+        "total_similarity_time": grading_result["total_similarity_time"],
+        "graded_at": graded_at,
+    }
+
+
+async def save_grading_results(db: AsyncSession, graded: Iterable[Tuple[int, Dict]]) -> List[Nilai]:
+    """
+    Simpan hasil penilaian banyak submission dengan dua statement: satu UPDATE ... FROM (VALUES ...)
+    untuk semua QuestionAnswer dan satu INSERT ... ON CONFLICT (submission_id) DO UPDATE untuk Nilai.
+    Tidak melakukan commit.
+    """
+    # Submission yang muncul dua kali cukup ditulis sekali (hasil terakhir)
+    graded_by_submission = dict(graded)
+    if not graded_by_submission:
+        return []
+
+    answer_rows = [
+        row
+        for submission_id, grading_result in graded_by_submission.items()
+        for row in _answer_rows(submission_id, grading_result)
+    ]
+    if answer_rows:
+        results = values(
+            column("submission_id", Integer),
+            column("question_id", Integer),
+            *(column(name, type_) for name, type_ in ANSWER_RESULT_COLUMNS),
+            name="hasil"
+        ).data(answer_rows)
+        await db.execute(
+            update(QuestionAnswer)
+            .where(
+                QuestionAnswer.submission_id == results.c.submission_id,
+                QuestionAnswer.question_id == results.c.question_id
+            )
+            .values({name: results.c[name] for name, _ in ANSWER_RESULT_COLUMNS})
+            .execution_options(synchronize_session=False)
+        )
+
+    graded_at = datetime.utcnow()
+    stmt = insert(Nilai).values([
+        _nilai_row(submission_id, grading_result, graded_at)
+        for submission_id, grading_result in graded_by_submission.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Nilai.submission_id],
+        set_={name: stmt.excluded[name] for name in NILAI_RESULT_COLUMNS}
+    )
+    result = await db.scalars(stmt.returning(Nilai), execution_options={"populate_existing": True})
+    return list(result.all())
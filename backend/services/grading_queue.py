@@ -0,0 +1,514 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import os
+import socket
+import time
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from core.db import SessionLocal
+from models.assignment import Assignment
+from models.assignment_submission import AssignmentSubmission, SubmissionType
+from models.nilai import Nilai
+from models.question_answer import QuestionAnswer
+from models.grading_job import GradingJob, GradingJobStatus
+from services.grading_tunneling import grade_submission_batch_via_tunnel, ensure_fully_graded
+from services.grading_persistence import save_grading_results
+from services.grading_fast_path import FAST_PATH_REASONS
+from services.grading_events import grading_events
+from services.ocr_service import extract_ocr_answers, OCRPendingError
+
+GRADING_WORKERS = max(1, int(os.getenv("GRADING_WORKERS", "2")))
+GRADING_POLL_INTERVAL = float(os.getenv("GRADING_POLL_INTERVAL", "5"))
+GRADING_MAX_ATTEMPTS = max(1, int(os.getenv("GRADING_MAX_ATTEMPTS", "3")))
+# Jeda retry pertama dalam detik, berlipat dua setiap percobaan berikutnya
+GRADING_RETRY_BACKOFF = float(os.getenv("GRADING_RETRY_BACKOFF", "15"))
+# Job running tanpa heartbeat selama GRADING_LEASE_TIMEOUT dianggap ditinggal worker yang mati
+GRADING_LEASE_TIMEOUT = float(os.getenv("GRADING_LEASE_TIMEOUT", "120"))
+GRADING_HEARTBEAT_INTERVAL = float(os.getenv("GRADING_HEARTBEAT_INTERVAL", "30"))
+# Error job yang worker-nya berulang kali mati (OOM, crash, pod dihentikan) saat menilainya
+LEASE_EXHAUSTED_ERROR = "Worker berhenti saat menilai submission ini sebanyak {attempts} kali (lease kedaluwarsa)"
+
+ACTIVE_STATUSES = (GradingJobStatus.PENDING, GradingJobStatus.RUNNING)
+
+# Status penilaian yang dilihat mahasiswa untuk submission-nya
+GRADING_PENDING = "grading_pending"
+GRADING_RUNNING = "grading_running"
+GRADING_FAILED = "grading_failed"
+GRADED = "graded"
+NOT_GRADED = "not_graded"
+
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+_stopping = False
+
+
+def build_submission_data(assignment: Assignment, submission: AssignmentSubmission) -> Dict:
+    return {
+        "assignment_info": {
+            "assignment_id": assignment.id,
+            "title": assignment.title,
+            "description": assignment.description or ""
+        },
+        "questions": [
+            {
+                "question_id": q.id,
+                "question_text": q.question_text,
+                "reference_answer": q.reference_answer,
+                "points": q.points,
+                "prompt_type": q.prompt_type,
+                "answer_key_embedding": q.answer_key_embedding
+            }
+            for q in assignment.questions
+        ],
+        "answers": [
+            {
+                "question_id": qa.question_id,
+                "answer_text": qa.answer_text
+            }
+            for qa in submission.question_answers
+        ]
+    }
+
+
+async def grade_and_store_submission(
+    db: AsyncSession,
+    submission_id: int,
+    on_question_graded: Optional[Callable[[Dict, bool, bool], None]] = None
+) -> Tuple[Nilai, Dict]:
+    """
+    Satu jalur penilaian untuk worker antrian dan penilaian langsung satu submission:
+    OCR (bila perlu), penilaian lewat tunnel, lalu simpan. Tidak melakukan commit akhir.
+    """
+    result = await db.execute(
+        select(AssignmentSubmission)
+        .options(
+            selectinload(AssignmentSubmission.assignment).selectinload(Assignment.questions),
+            selectinload(AssignmentSubmission.question_answers)
+        )
+        .where(AssignmentSubmission.id == submission_id)
+    )
+    submission = result.scalar_one_or_none()
+    if not submission:
+        raise RuntimeError(f"Submission {submission_id} tidak ditemukan")
+
+    # Submission OCR baru punya jawaban setelah file-nya dibaca service OCR
+    if submission.submission_type == SubmissionType.OCR and not submission.question_answers:
+        await extract_ocr_answers(db, submission)
+
+    submission_data = build_submission_data(submission.assignment, submission)
+    grading_result = await grade_submission_batch_via_tunnel(submission_data, on_question_graded=on_question_graded)
+    # Raise jika ada pertanyaan gagal: job di-retry dan tidak ada Nilai parsial yang tersimpan
+    ensure_fully_graded(grading_result)
+    saved = await save_grading_results(db, [(submission.id, grading_result)]) # type: ignore
+    return saved[0], grading_result
+
+
+async def find_submissions_to_grade(
+    db: AsyncSession,
+    assignment_id: int,
+    questions_changed_at: Optional[datetime] = None,
+    force: bool = False
+) -> List[int]:
+    """
+    Submission yang perlu dinilai: belum punya Nilai, atau ada soal yang berubah (questions_changed_at)
+    setelah graded_at. Jawaban tidak pernah diubah setelah dikumpulkan. force=True memilih semua.
+    """
+    query = (
+        select(AssignmentSubmission.id)
+        .outerjoin(Nilai, Nilai.submission_id == AssignmentSubmission.id)
+        .where(AssignmentSubmission.assignment_id == assignment_id)
+        .order_by(AssignmentSubmission.id)
+    )
+    if not force:
+        stale_conditions = [Nilai.id.is_(None)]
+        if questions_changed_at is not None:
+            stale_conditions.append(Nilai.graded_at < questions_changed_at)
+        query = query.where(or_(*stale_conditions))
+
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def count_submissions(db: AsyncSession, assignment_id: int) -> int:
+    result = await db.execute(
+        select(func.count(AssignmentSubmission.id)).where(AssignmentSubmission.assignment_id == assignment_id)
+    )
+    return result.scalar_one()
+
+
+# ==================== JOB QUEUE ====================
+async def enqueue_grading_jobs(db: AsyncSession, assignment_id: int, submission_ids: Iterable[int]) -> Dict:
+    submission_ids = list(submission_ids)
+    if not submission_ids:
+        return {"queued": 0, "already_queued": 0, "job_ids": []}
+
+    # Submission yang masih punya job aktif tidak di-enqueue ulang
+    result = await db.execute(
+        select(GradingJob.submission_id).where(
+            GradingJob.submission_id.in_(submission_ids),
+            GradingJob.status.in_(ACTIVE_STATUSES)
+        )
+    )
+    active_ids = set(result.scalars().all())
+
+    jobs = [
+        GradingJob(assignment_id=assignment_id, submission_id=submission_id)
+        for submission_id in submission_ids
+        if submission_id not in active_ids
+    ]
+    db.add_all(jobs)
+    await db.commit()
+
+    notify_workers()
+    return {
+        "queued": len(jobs),
+        "already_queued": len(active_ids),
+        "job_ids": [job.id for job in jobs]
+    }
+
+
+async def get_assignment_progress(db: AsyncSession, assignment_id: int) -> Dict:
+    # Hanya job terbaru per submission yang dihitung agar re-run tidak menggandakan angka
+    latest_ids = (
+        select(GradingJob.id)
+        .where(GradingJob.assignment_id == assignment_id)
+        .distinct(GradingJob.submission_id)
+        .order_by(GradingJob.submission_id, GradingJob.id.desc())
+    )
+    result = await db.execute(
+        select(GradingJob).where(GradingJob.id.in_(latest_ids)).order_by(GradingJob.id)
+    )
+    jobs = result.scalars().all()
+
+    counts = {status.value: 0 for status in GradingJobStatus}
+    for job in jobs:
+        counts[job.status.value] += 1
+
+    total = len(jobs)
+    finished = counts[GradingJobStatus.DONE.value] + counts[GradingJobStatus.FAILED.value]
+    return {
+        "assignment_id": assignment_id,
+        "total_jobs": total,
+        **counts,
+        "progress": round(finished / total * 100, 2) if total > 0 else 0.0,
+        "is_running": counts[GradingJobStatus.PENDING.value] + counts[GradingJobStatus.RUNNING.value] > 0,
+        "failures": [
+            {"job_id": job.id, "submission_id": job.submission_id, "error": job.error}
+            for job in jobs
+            if job.status == GradingJobStatus.FAILED
+        ],
+        "fast_path": await get_fast_path_stats(db, assignment_id)
+    }
+
+
+async def get_fast_path_stats(db: AsyncSession, assignment_id: int) -> Dict:
+    # Dihitung dari QuestionAnswer.graded_by: bertahan setelah restart, sama di semua proses,
+    # dan penilaian ulang menimpa nilai lama sehingga tidak terhitung dua kali
+    result = await db.execute(
+        select(QuestionAnswer.graded_by, func.count(QuestionAnswer.id))
+        .join(AssignmentSubmission, AssignmentSubmission.id == QuestionAnswer.submission_id)
+        .where(AssignmentSubmission.assignment_id == assignment_id, QuestionAnswer.graded_by.is_not(None))
+        .group_by(QuestionAnswer.graded_by)
+    )
+    counts = dict(result.all())
+    stats = {reason: counts.get(reason, 0) for reason in FAST_PATH_REASONS}
+    stats["questions"] = sum(counts.values())
+    stats["fast_path"] = sum(stats[reason] for reason in FAST_PATH_REASONS)
+    stats["hit_rate"] = round(stats["fast_path"] / stats["questions"], 4) if stats["questions"] else 0.0
+    return stats
+
+
+async def get_submission_grading_status(db: AsyncSession, submission_id: int) -> Dict:
+    result = await db.execute(
+        select(GradingJob)
+        .where(GradingJob.submission_id == submission_id)
+        .order_by(GradingJob.id.desc())
+        .limit(1)
+    )
+    job = result.scalar_one_or_none()
+    result = await db.execute(select(Nilai).where(Nilai.submission_id == submission_id))
+    nilai = result.scalar_one_or_none()
+
+    if job is not None and job.status == GradingJobStatus.PENDING:
+        grading_status = GRADING_PENDING
+    elif job is not None and job.status == GradingJobStatus.RUNNING:
+        grading_status = GRADING_RUNNING
+    elif nilai is not None:
+        grading_status = GRADED
+    elif job is not None and job.status == GradingJobStatus.FAILED:
+        grading_status = GRADING_FAILED
+    else:
+        grading_status = NOT_GRADED
+
+    return {
+        "submission_id": submission_id,
+        "grading_status": grading_status,
+        "job_id": job.id if job else None,
+        "attempts": job.attempts if job else 0,
+        "error": job.error if job and job.status == GradingJobStatus.FAILED else None,
+        "total_score": nilai.total_score if nilai else None,
+        "max_score": nilai.max_score if nilai else None,
+        "percentage": nilai.percentage if nilai else None,
+        "graded_at": nilai.graded_at if nilai else None
+    }
+
+
+def _stale_lease_condition(now: datetime):
+    return and_(
+        GradingJob.status == GradingJobStatus.RUNNING,
+        or_(GradingJob.locked_at.is_(None), GradingJob.locked_at < now - timedelta(seconds=GRADING_LEASE_TIMEOUT))
+    )
+
+
+async def _fail_exhausted_job(db: AsyncSession, job: GradingJob, now: datetime) -> None:
+    # Submission yang terus membuat worker mati tidak diambil ulang selamanya
+    error = LEASE_EXHAUSTED_ERROR.format(attempts=job.attempts)
+    print(f"[grading-worker] Job {job.id}: {error}, ditandai gagal")
+    job.status = GradingJobStatus.FAILED # type: ignore
+    job.error = error # type: ignore
+    job.finished_at = now # type: ignore
+    job.worker_id = None # type: ignore
+    job.locked_at = None # type: ignore
+    await db.commit()
+    grading_events.publish(job.assignment_id, "submission_failed", { # type: ignore
+        "job_id": job.id,
+        "submission_id": job.submission_id,
+        "attempt": job.attempts,
+        "will_retry": False,
+        "error": error
+    })
+
+
+async def _claim_next_job(worker_name: str) -> Optional[int]:
+    async with SessionLocal() as db: # type: ignore
+        while True:
+            now = datetime.utcnow()
+            result = await db.execute(
+                select(GradingJob)
+                .where(or_(
+                    and_(
+                        GradingJob.status == GradingJobStatus.PENDING,
+                        or_(GradingJob.run_after.is_(None), GradingJob.run_after <= now)
+                    ),
+                    # Lease kedaluwarsa: worker pemiliknya mati tanpa sempat melepas job
+                    _stale_lease_condition(now)
+                ))
+                .order_by(GradingJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = result.scalar_one_or_none()
+            if not job:
+                return None
+            if job.status == GradingJobStatus.RUNNING:
+                if job.attempts >= GRADING_MAX_ATTEMPTS: # type: ignore
+                    await _fail_exhausted_job(db, job, now)
+                    continue
+                print(f"[grading-worker] Lease job {job.id} dari {job.worker_id} kedaluwarsa, diambil alih")
+            job.status = GradingJobStatus.RUNNING # type: ignore
+            job.attempts = (job.attempts or 0) + 1 # type: ignore
+            job.started_at = now # type: ignore
+            job.worker_id = worker_name # type: ignore
+            job.locked_at = now # type: ignore
+            job_id = job.id
+            await db.commit()
+            return job_id # type: ignore
+
+
+async def _heartbeat(job_id: int, worker_name: str) -> None:
+    while True:
+        await asyncio.sleep(GRADING_HEARTBEAT_INTERVAL)
+        try:
+            async with SessionLocal() as db: # type: ignore
+                await db.execute(
+                    update(GradingJob)
+                    .where(GradingJob.id == job_id, GradingJob.worker_id == worker_name)
+                    .values(locked_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"[grading-worker] Heartbeat job {job_id} gagal: {e}")
+
+
+async def _run_job(job_id: int, worker_name: str) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_name))
+    try:
+        await _execute_job(job_id)
+    finally:
+        heartbeat.cancel()
+
+
+async def _execute_job(job_id: int) -> None:
+    async with SessionLocal() as db: # type: ignore
+        job = await db.get(GradingJob, job_id)
+        if job is None:
+            return
+        assignment_id = job.assignment_id
+        submission_id = job.submission_id
+
+        def on_question_graded(item: Dict, succeeded: bool, fast_path: bool) -> None:
+            grading_events.publish(assignment_id, "question_graded", { # type: ignore
+                "job_id": job_id,
+                "submission_id": submission_id,
+                "question_id": item["question_id"],
+                "succeeded": succeeded,
+                "fast_path": fast_path,
+                "final_score": item["final_score"],
+                "embedding_similarity": item["embedding_similarity"],
+                "llm_time": item["llm_time"],
+                "similarity_time": item["similarity_time"],
+                "error": None if succeeded else item["feedback"]
+            })
+
+        grading_events.publish(assignment_id, "submission_started", { # type: ignore
+            "job_id": job_id,
+            "submission_id": submission_id,
+            "attempt": job.attempts
+        })
+        start_time = time.time()
+        try:
+            print(f"[grading-worker] Menilai submission {submission_id} (job {job_id})...")
+            nilai, _ = await grade_and_store_submission(db, submission_id, on_question_graded) # type: ignore
+            job.status = GradingJobStatus.DONE # type: ignore
+            job.error = None # type: ignore
+            job.finished_at = datetime.utcnow() # type: ignore
+            await db.commit()
+            grading_events.publish(assignment_id, "submission_graded", { # type: ignore
+                "job_id": job_id,
+                "submission_id": submission_id,
+                "total_score": nilai.total_score,
+                "max_score": nilai.max_score,
+                "percentage": nilai.percentage,
+                "total_llm_time": nilai.total_llm_time,
+                "total_similarity_time": nilai.total_similarity_time,
+                "duration": round(time.time() - start_time, 3)
+            })
+            await _publish_progress(db, assignment_id) # type: ignore
+        except OCRPendingError as e:
+            # Worker tidak ditahan selama OCR berjalan; job diambil lagi setelah retry_after
+            await db.rollback()
+            job = await db.get(GradingJob, job_id)
+            if job is None:
+                return
+            job.status = GradingJobStatus.PENDING # type: ignore
+            job.attempts = max(0, job.attempts - 1) # type: ignore
+            job.run_after = datetime.utcnow() + timedelta(seconds=e.retry_after) # type: ignore
+            job.worker_id = None # type: ignore
+            job.locked_at = None # type: ignore
+            await db.commit()
+            grading_events.publish(assignment_id, "ocr_pending", { # type: ignore
+                "job_id": job_id,
+                "submission_id": submission_id,
+                "detail": str(e)
+            })
+        except Exception as e:
+            print(f"[grading-worker] Job {job_id} gagal: {e}")
+            await db.rollback()
+            job = await db.get(GradingJob, job_id)
+            if job is None:
+                return
+            job.error = str(e) # type: ignore
+            if job.attempts >= GRADING_MAX_ATTEMPTS: # type: ignore
+                job.status = GradingJobStatus.FAILED # type: ignore
+                job.finished_at = datetime.utcnow() # type: ignore
+            else:
+                job.status = GradingJobStatus.PENDING # type: ignore
+                backoff = GRADING_RETRY_BACKOFF * 2 ** (job.attempts - 1) # type: ignore
+                job.run_after = datetime.utcnow() + timedelta(seconds=backoff) # type: ignore
+                print(f"[grading-worker] Job {job_id} dicoba lagi dalam {backoff:.0f} detik")
+            job.worker_id = None # type: ignore
+            job.locked_at = None # type: ignore
+            await db.commit()
+            grading_events.publish(assignment_id, "submission_failed", { # type: ignore
+                "job_id": job_id,
+                "submission_id": submission_id,
+                "attempt": job.attempts,
+                "will_retry": job.status == GradingJobStatus.PENDING,
+                "error": str(e),
+                "duration": round(time.time() - start_time, 3)
+            })
+            await _publish_progress(db, assignment_id) # type: ignore
+
+
+async def _publish_progress(db: AsyncSession, assignment_id: int) -> None:
+    # Progres dihitung sekali per job selesai lalu dibagikan ke semua stream yang mendengarkan
+    if not grading_events.has_subscribers(assignment_id):
+        return
+    try:
+        progress = await get_assignment_progress(db, assignment_id)
+    except Exception as e:
+        print(f"[grading-worker] Gagal menghitung progres assignment {assignment_id}: {e}")
+        return
+    grading_events.publish(assignment_id, "progress", progress)
+
+
+async def _worker_loop(worker_id: int) -> None:
+    assert _wakeup is not None
+    worker_name = f"{socket.gethostname()}:{os.getpid()}:{worker_id}"
+    while not _stopping:
+        _wakeup.clear()
+        try:
+            job_id = await _claim_next_job(worker_name)
+        except Exception as e:
+            print(f"[grading-worker {worker_id}] Gagal mengambil job: {e}")
+            job_id = None
+
+        if job_id is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=GRADING_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _run_job(job_id, worker_name)
+        except Exception as e:
+            # Error DB di luar penanganan job tidak boleh mematikan worker; lease job
+            # dibiarkan kedaluwarsa sehingga job diambil ulang setelah GRADING_LEASE_TIMEOUT
+            print(f"[grading-worker {worker_id}] Job {job_id} berhenti karena error tak tertangani: {e}")
+            await asyncio.sleep(GRADING_POLL_INTERVAL)
+
+
+def notify_workers() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def requeue_interrupted_jobs() -> int:
+    # Hanya job "running" yang lease-nya kedaluwarsa; job milik proses lain yang masih hidup
+    # (multi worker uvicorn, rolling restart) tetap dibiarkan berjalan
+    # Job yang sudah mencapai GRADING_MAX_ATTEMPTS dibiarkan; _claim_next_job menandainya gagal
+    async with SessionLocal() as db: # type: ignore
+        result = await db.execute(
+            update(GradingJob)
+            .where(_stale_lease_condition(datetime.utcnow()), GradingJob.attempts < GRADING_MAX_ATTEMPTS)
+            .values(status=GradingJobStatus.PENDING, worker_id=None, locked_at=None)
+        )
+        await db.commit()
+        return result.rowcount or 0 # type: ignore
+
+
+async def start_grading_workers(num_workers: int = GRADING_WORKERS) -> None:
+    global _wakeup, _stopping
+    if _workers:
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    requeued = await requeue_interrupted_jobs()
+    if requeued:
+        print(f"[grading-worker] {requeued} job terputus dikembalikan ke antrian")
+    for worker_id in range(num_workers):
+        _workers.append(asyncio.create_task(_worker_loop(worker_id)))
+    print(f"[grading-worker] {num_workers} worker penilaian berjalan")
+
+
+async def stop_grading_workers() -> None:
+    global _stopping
+    _stopping = True
+    notify_workers()
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
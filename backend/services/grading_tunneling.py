@@ -1,81 +1,240 @@
-from typing import Dict
-import requests
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import httpx
+import math
 import os
+from services.grading_fast_path import grade_fast_path
 
 AI_TUNNEL_URL = os.getenv("AI_TUNNEL_URL", "http://localhost:5555/grade")
 DEFAULT_MODEL = os.getenv("AI_MODEL", "qwen2.5:3b-instruct")
 TIMEOUT = int(os.getenv("AI_TIMEOUT", "120"))
+CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+# Jumlah maksimum pertanyaan satu submission yang dinilai bersamaan
+MAX_CONCURRENCY = max(1, int(os.getenv("AI_MAX_CONCURRENCY", "4")))
+# Endpoint batch grader (/grade/batch); dipakai otomatis jika server mendukung
+AI_TUNNEL_BATCH_URL = os.getenv("AI_TUNNEL_BATCH_URL", AI_TUNNEL_URL.rstrip("/") + "/batch")
+USE_BATCH = os.getenv("AI_USE_BATCH", "true").lower() == "true"
+BATCH_SIZE = max(1, int(os.getenv("AI_BATCH_SIZE", "16")))
+# Endpoint embedding grader (/embed) untuk artefak soal
+AI_TUNNEL_EMBED_URL = os.getenv("AI_TUNNEL_EMBED_URL", AI_TUNNEL_URL.rstrip("/").rsplit("/", 1)[0] + "/embed")
+EMBED_TIMEOUT = float(os.getenv("AI_EMBED_TIMEOUT", "15"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+# None = belum diketahui, False = server grader tidak punya /grade/batch
+_batch_supported: Optional[bool] = None
+
+
+class BatchNotSupportedError(Exception):
+    pass
+
+
+class IncompleteGradingError(RuntimeError):
+    # Sebagian pertanyaan gagal dinilai; hasil submission tidak boleh disimpan sebagai Nilai
+    pass
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+
+async def init_http_client() -> None:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Fallback jika dipanggil di luar lifecycle aplikasi (misal dari seeder/script)
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+def _parse_tunnel_result(result: Dict, question_points: int) -> Dict:
+    final_score_percentage = result.get("final_score", 0.0)
+    rubric_scores = result.get("rubric_scores", {})
+    embedding_similarity = result.get("embedding_similarity", 0.0)
+    feedback = result.get("feedback", "")
+    llm_time = result.get("llm_time", 0.0)
+    similarity_time = result.get("similarity_time", 0.0)
+    final_score = round((final_score_percentage / 100) * question_points, 2)
+    final_score = max(0.0, final_score)
+    
+    print(f"Penilaian Via AI Tunnel:")
+    print(f"   - Final Score: {final_score}/{question_points} ({final_score_percentage}%)")
+    print(f"   - Rubric Scores: {rubric_scores}")
+    print(f"   - Embedding Similarity: {embedding_similarity}")
+    print(f"   - LLM Time: {llm_time}s, Similarity Time: {similarity_time}s")
+    
+    return {
+        "final_score": final_score,
+        "feedback": feedback,
+        "rubric_scores": {
+            "pemahaman": max(0.0, rubric_scores.get("pemahaman", 0.0)),
+            "kelengkapan": max(0.0, rubric_scores.get("kelengkapan", 0.0)),
+            "kejelasan": max(0.0, rubric_scores.get("kejelasan", 0.0)),
+            "analisis": max(0.0, rubric_scores.get("analisis", 0.0)),
+            "rata_rata": max(0.0, rubric_scores.get("rata_rata", 0.0)),
+        },
+        "embedding_similarity": max(0.0, embedding_similarity),
+        "llm_time": llm_time,
+        "similarity_time": similarity_time
+    }
+
+def _embedding_payload(answer_key_embedding: Optional[Dict]) -> Dict:
+    # Grader hanya memakai vektor ini jika embedding_model sama dengan modelnya sendiri
+    if not answer_key_embedding:
+        return {}
+    return {
+        "answer_key_embedding": answer_key_embedding["vector"],
+        "embedding_model": answer_key_embedding["model"]
+    }
 
 async def grade_question_via_tunnel(
     question_text: str,
     reference_answer: str,
     student_answer: str,
     question_points: int,
-    model: str = DEFAULT_MODEL
+    model: str = DEFAULT_MODEL,
+    prompt_type: Optional[str] = None,
+    answer_key_embedding: Optional[Dict] = None
 ) -> Dict:
     payload = {
         "question": question_text,
         "answer_key": reference_answer,
         "student_answer": student_answer,
-        "model": model
+        "model": model,
+        "prompt_type": prompt_type,
+        **_embedding_payload(answer_key_embedding)
     }
     
     try:
         print(f"\n🔹 Calling AI tunnel for question grading...")
-        response = requests.post(AI_TUNNEL_URL, json=payload, timeout=TIMEOUT)
+        response = await get_http_client().post(AI_TUNNEL_URL, json=payload)
         response.raise_for_status()
-        result = response.json()
-        final_score_percentage = result.get("final_score", 0.0)
-        rubric_scores = result.get("rubric_scores", {})
-        embedding_similarity = result.get("embedding_similarity", 0.0)
-        feedback = result.get("feedback", "")
-        llm_time = result.get("llm_time", 0.0)
-        similarity_time = result.get("similarity_time", 0.0)
-        final_score = round((final_score_percentage / 100) * question_points, 2)
-        final_score = max(0.0, final_score)
-        
-        print(f"Penilaian Via AI Tunnel:")
-        print(f"   - Final Score: {final_score}/{question_points} ({final_score_percentage}%)")
-        print(f"   - Rubric Scores: {rubric_scores}")
-        print(f"   - Embedding Similarity: {embedding_similarity}")
-        print(f"   - LLM Time: {llm_time}s, Similarity Time: {similarity_time}s")
-        
-        return {
-            "final_score": final_score,
-            "feedback": feedback,
-            "rubric_scores": {
-                "pemahaman": max(0.0, rubric_scores.get("pemahaman", 0.0)),
-                "kelengkapan": max(0.0, rubric_scores.get("kelengkapan", 0.0)),
-                "kejelasan": max(0.0, rubric_scores.get("kejelasan", 0.0)),
-                "analisis": max(0.0, rubric_scores.get("analisis", 0.0)),
-                "rata_rata": max(0.0, rubric_scores.get("rata_rata", 0.0)),
-            },
-            "embedding_similarity": max(0.0, embedding_similarity),
-            "llm_time": llm_time,
-            "similarity_time": similarity_time
-        }
-    except requests.exceptions.Timeout:
+        return _parse_tunnel_result(response.json(), question_points)
+    except httpx.TimeoutException:
+        raise RuntimeError("Permintaan ke server AI tunnel melebihi batas waktu.")
+    except httpx.HTTPError:
+        raise RuntimeError("Tidak dapat terhubung ke server AI tunnel.")
+    except Exception:
+        raise RuntimeError("Terjadi kesalahan saat memproses permintaan ke AI tunnel.")
+
+async def grade_questions_batch_via_tunnel(
+    items: List[Dict],
+    model: str = DEFAULT_MODEL
+) -> List[Union[Dict, Exception]]:
+    payload = {
+        "items": [
+            {
+                "question": item["question_text"],
+                "answer_key": item["reference_answer"],
+                "student_answer": item["student_answer"],
+                "prompt_type": item.get("prompt_type"),
+                **_embedding_payload(item.get("answer_key_embedding"))
+            }
+            for item in items
+        ],
+        "model": model
+    }
+    
+    try:
+        print(f"\n🔹 Calling AI tunnel batch untuk {len(items)} pertanyaan...")
+        response = await get_http_client().post(
+            AI_TUNNEL_BATCH_URL,
+            json=payload,
+            # Grader menilai item batch secara paralel; batas waktu mengikuti jumlah gelombang, bukan jumlah item
+            timeout=httpx.Timeout(TIMEOUT * math.ceil(len(items) / MAX_CONCURRENCY), connect=CONNECT_TIMEOUT)
+        )
+        if response.status_code in (404, 405):
+            raise BatchNotSupportedError()
+        response.raise_for_status()
+        raw_results = response.json()["results"]
+    except BatchNotSupportedError:
+        raise
+    except httpx.TimeoutException:
         raise RuntimeError("Permintaan ke server AI tunnel melebihi batas waktu.")
-    except requests.exceptions.RequestException:
+    except httpx.HTTPError:
         raise RuntimeError("Tidak dapat terhubung ke server AI tunnel.")
     except Exception:
         raise RuntimeError("Terjadi kesalahan saat memproses permintaan ke AI tunnel.")
+    
+    outcomes: List[Union[Dict, Exception]] = []
+    for item, raw in zip(items, raw_results):
+        if "error" in raw:
+            outcomes.append(RuntimeError(f"AI tunnel gagal menilai pertanyaan: {raw['error']}"))
+        else:
+            outcomes.append(_parse_tunnel_result(raw, item["points"]))
+    return outcomes
+
+
+async def embed_texts_via_tunnel(texts: List[str]) -> Dict:
+    try:
+        response = await get_http_client().post(
+            AI_TUNNEL_EMBED_URL,
+            json={"texts": texts},
+            timeout=httpx.Timeout(EMBED_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        raise RuntimeError("Permintaan embedding ke server AI tunnel melebihi batas waktu.")
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Gagal meminta embedding dari server AI tunnel: {e}")
+
 
-    # except requests.exceptions.Timeout:
-    #     raise RuntimeError(f"Permintaan AI tunnel timed out setelah {TIMEOUT} detik")
-    # except requests.exceptions.RequestException as e:
-    #     raise RuntimeError(f"Gagal terhubung ke {AI_TUNNEL_URL}: {e}")
-    # except Exception as e:
-    #     raise RuntimeError(f"Error saat memproses AI Tunnel: {e}")
+def _failed_result(question_id: int, error: Exception) -> Dict:
+    return {
+        "question_id": question_id,
+        "final_score": 0.0,
+        "feedback": f"Grading failed: {str(error)}",
+        "rubric_scores": {
+            "pemahaman": 0.0,
+            "kelengkapan": 0.0,
+            "kejelasan": 0.0,
+            "analisis": 0.0,
+            "rata_rata": 0.0
+        },
+        "embedding_similarity": 0.0,
+        "llm_time": 0.0,
+        "similarity_time": 0.0,
+        "graded_by": "llm"
+    }
 
 
-async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
+async def grade_submission_batch_via_tunnel(
+    submission_data: Dict,
+    max_concurrency: Optional[int] = None,
+    on_question_graded: Optional[Callable[[Dict, bool, bool], None]] = None
+) -> Dict:
+    """
+    on_question_graded(item, succeeded, fast_path) dipanggil segera setelah setiap pertanyaan
+    selesai dinilai (bukan setelah seluruh submission), misalnya untuk stream progres.
+    """
+    global _batch_supported
     questions = submission_data.get("questions", [])
     answers = submission_data.get("answers", [])
     
     answers_map = {a["question_id"]: a for a in answers}
+    semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENCY)
     
     results = []
+    failed_questions = []
     total_score = 0.0
     total_points = 0
     total_llm_time = 0.0
@@ -91,64 +250,126 @@ async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
     print(f"🚀 Memulai penilaian batch untuk {len(questions)} pertanyaan melalui AI tunnel")
     print(f"{'='*60}")
     
-    for idx, question in enumerate(questions, 1):
+    def to_result_item(question_id: int, grading_result: Dict) -> Dict:
+        return {
+            "question_id": question_id,
+            "final_score": grading_result["final_score"],
+            "feedback": grading_result["feedback"],
+            "rubric_scores": grading_result["rubric_scores"],
+            "embedding_similarity": grading_result["embedding_similarity"],
+            "llm_time": grading_result["llm_time"],
+            "similarity_time": grading_result["similarity_time"],
+            "graded_by": grading_result.get("graded_by", "llm")
+        }
+    
+    def student_answer_for(question_id: int) -> str:
+        answer_data = answers_map.get(question_id)
+        return answer_data["answer_text"] if answer_data else ""
+    
+    def report(item: Dict, succeeded: bool, fast_path: bool = False) -> None:
+        if on_question_graded is None:
+            return
+        try:
+            on_question_graded(item, succeeded, fast_path)
+        except Exception as e:
+            # Callback progres tidak boleh menggagalkan penilaian
+            print(f"Callback progres gagal untuk pertanyaan {item['question_id']}: {e}")
+    
+    async def grade_one(idx: int, question: Dict) -> Tuple[Dict, bool]:
         question_id = question["question_id"]
-        question_text = question["question_text"]
-        reference_answer = question["reference_answer"]
-        points = question["points"]
+        student_answer = student_answer_for(question_id)
         
-        answer_data = answers_map.get(question_id)
-        student_answer = answer_data["answer_text"] if answer_data else ""
+        async with semaphore:
+            print(f"\nPenilaian pertanyaan {idx}/{len(questions)} (ID: {question_id}, Points: {question['points']})")
+            try:
+                grading_result = await grade_question_via_tunnel(
+                    question_text=question["question_text"],
+                    reference_answer=question["reference_answer"],
+                    student_answer=student_answer,
+                    question_points=question["points"],
+                    prompt_type=question.get("prompt_type"),
+                    answer_key_embedding=question.get("answer_key_embedding")
+                )
+            except Exception as e:
+                print(f"Error menilai  {question_id}: {e}")
+                report(_failed_result(question_id, e), False)
+                return _failed_result(question_id, e), False
         
-        print(f"\nPenilaian pertanyaan {idx}/{len(questions)} (ID: {question_id}, Points: {points})")
+        item = to_result_item(question_id, grading_result)
+        report(item, True)
+        return item, True
+    
+    async def grade_chunk(chunk: List[Dict]) -> List[Tuple[Dict, bool]]:
+        items = [{**question, "student_answer": student_answer_for(question["question_id"])} for question in chunk]
+        async with semaphore:
+            try:
+                outcomes = await grade_questions_batch_via_tunnel(items)
+            except BatchNotSupportedError:
+                raise
+            except Exception as e:
+                print(f"Error menilai batch {[q['question_id'] for q in chunk]}: {e}")
+                failed_chunk = [(_failed_result(q["question_id"], e), False) for q in chunk]
+                for item, succeeded in failed_chunk:
+                    report(item, succeeded)
+                return failed_chunk
         
+        graded_chunk = []
+        for question, outcome in zip(chunk, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error menilai  {question['question_id']}: {outcome}")
+                graded_chunk.append((_failed_result(question["question_id"], outcome), False))
+            else:
+                graded_chunk.append((to_result_item(question["question_id"], outcome), True))
+        for item, succeeded in graded_chunk:
+            report(item, succeeded)
+        return graded_chunk
+    
+    # Jawaban kosong/identik dinilai langsung; sisanya lewat LLM
+    fast_results = await grade_fast_path(questions, student_answer_for)
+    for question_id, fast_result in fast_results.items():
+        report(to_result_item(question_id, fast_result), True, fast_path=True)
+    llm_questions = [q for q in questions if q["question_id"] not in fast_results]
+    
+    graded: Optional[List[Tuple[Dict, bool]]] = None
+    if not llm_questions:
+        graded = []
+    elif USE_BATCH and _batch_supported is not False:
+        chunks = [llm_questions[i:i + BATCH_SIZE] for i in range(0, len(llm_questions), BATCH_SIZE)]
         try:
-            grading_result = await grade_question_via_tunnel(
-                question_text=question_text,
-                reference_answer=reference_answer,
-                student_answer=student_answer,
-                question_points=points
-            )
-            
-            results.append({
-                "question_id": question_id,
-                "final_score": grading_result["final_score"],
-                "feedback": grading_result["feedback"],
-                "rubric_scores": grading_result["rubric_scores"],
-                "embedding_similarity": grading_result["embedding_similarity"],
-                "llm_time": grading_result["llm_time"],
-                "similarity_time": grading_result["similarity_time"]
-            })
-            
-            total_score += grading_result["final_score"]
-            total_points += points
-            total_llm_time += grading_result["llm_time"]
-            total_similarity_time += grading_result["similarity_time"]
-            
-            aggregate_pemahaman.append(grading_result["rubric_scores"]["pemahaman"])
-            aggregate_kelengkapan.append(grading_result["rubric_scores"]["kelengkapan"])
-            aggregate_kejelasan.append(grading_result["rubric_scores"]["kejelasan"])
-            aggregate_analisis.append(grading_result["rubric_scores"]["analisis"])
-            aggregate_similarity.append(grading_result["embedding_similarity"])
+            graded_chunks = await asyncio.gather(*(grade_chunk(chunk) for chunk in chunks))
+            graded = [item for graded_chunk in graded_chunks for item in graded_chunk]
+            _batch_supported = True
+        except BatchNotSupportedError:
+            print("Server AI tunnel tidak mendukung /grade/batch, kembali ke penilaian per pertanyaan")
+            _batch_supported = False
+    
+    if graded is None:
+        # Semua pertanyaan dinilai bersamaan, hasil tetap mengikuti urutan pertanyaan
+        graded = await asyncio.gather(
+            *(grade_one(idx, question) for idx, question in enumerate(llm_questions, 1))
+        )
+    
+    graded_by_id = {question["question_id"]: outcome for question, outcome in zip(llm_questions, graded)}
+    for question_id, fast_result in fast_results.items():
+        graded_by_id[question_id] = (to_result_item(question_id, fast_result), True)
+    
+    for question in questions:
+        item, succeeded = graded_by_id[question["question_id"]]
+        results.append(item)
+        total_points += question["points"]
+        if not succeeded:
+            failed_questions.append({"question_id": question["question_id"], "error": item["feedback"]})
+            continue
         
-        except Exception as e:
-            print(f"Error menilai  {question_id}: {e}")
-            results.append({
-                "question_id": question_id,
-                "final_score": 0.0,
-                "feedback": f"Grading failed: {str(e)}",
-                "rubric_scores": {
-                    "pemahaman": 0.0,
-                    "kelengkapan": 0.0,
-                    "kejelasan": 0.0,
-                    "analisis": 0.0,
-                    "rata_rata": 0.0
-                },
-                "embedding_similarity": 0.0,
-                "llm_time": 0.0,
-                "similarity_time": 0.0
-            })
-            total_points += points
+        total_score += item["final_score"]
+        total_llm_time += item["llm_time"]
+        total_similarity_time += item["similarity_time"]
+        
+        aggregate_pemahaman.append(item["rubric_scores"]["pemahaman"])
+        aggregate_kelengkapan.append(item["rubric_scores"]["kelengkapan"])
+        aggregate_kejelasan.append(item["rubric_scores"]["kejelasan"])
+        aggregate_analisis.append(item["rubric_scores"]["analisis"])
+        aggregate_similarity.append(item["embedding_similarity"])
     
     percentage = round((total_score / total_points * 100), 2) if total_points > 0 else 0.0
     num_questions = len(questions)
@@ -181,5 +402,19 @@ async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
             "avg_embedding_similarity": avg_similarity
         },
         "total_llm_time": round(total_llm_time, 3),
-        "total_similarity_time": round(total_similarity_time, 3)
-    }
\ No newline at end of file
+        "total_similarity_time": round(total_similarity_time, 3),
+        "failed_questions": failed_questions
+    }
+
+
+def ensure_fully_graded(grading_result: Dict) -> None:
+    """
+    Tolak hasil yang memuat pertanyaan gagal (nilai 0 + "Grading failed"). Tanpa Nilai,
+    submission tetap terpilih oleh penilaian ulang inkremental dan job bisa di-retry.
+    """
+    failed = grading_result.get("failed_questions") or []
+    if failed:
+        ids = ", ".join(str(f["question_id"]) for f in failed)
+        raise IncompleteGradingError(
+            f"{len(failed)} dari {len(grading_result['results'])} pertanyaan gagal dinilai (ID: {ids}): {failed[0]['error']}"
+        )
\ No newline at end of file
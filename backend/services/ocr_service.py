@@ -1,30 +1,147 @@
-# from typing import Dict
-# from fastapi import UploadFile
-
-# async def extract_text_from_pdf(file: UploadFile) -> Dict[str, any]: # type: ignore
-#     return {
-#         "text": "Ini di ekstrak teks dari PDF. Implement OCR logic here.",
-#         "pages": 1,
-#         "confidence": 0.95,
-#         "status": "success"
-#     }
-
-# async def extract_text_from_image(file: UploadFile) -> Dict[str, any]: # type: ignore
-#     return {
-#         "text": "Ini di ekstrak teks dari gambar. Implement OCR logic here.",
-#         "confidence": 0.95,
-#         "status": "success"
-#     }
-
-# async def process_uploaded_file(file: UploadFile) -> str:
-#     file_extension = file.filename.split(".")[-1].lower() # type: ignore
-
-#     if file_extension == "pdf":
-#         result = await extract_text_from_pdf(file)
-#     elif file_extension in ["jpg", "jpeg", "png"]:
-#         result = await extract_text_from_image(file)
-#     else:
-#         return "Unsupported file format"
-
-#     return result.get("text", "")
+from typing import Dict, List, Optional
+from datetime import datetime
+import os
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.assignment_submission import AssignmentSubmission
+from models.question_answer import QuestionAnswer
+from services.grading_tunneling import get_http_client, CONNECT_TIMEOUT
 
+# Service OCR berjalan terpisah (tr-ocr/ocr_server.py) dan memuat model TrOCR sekali
+OCR_SERVICE_URL = os.getenv("OCR_SERVICE_URL", "http://localhost:5556").rstrip("/")
+OCR_REQUEST_TIMEOUT = float(os.getenv("OCR_REQUEST_TIMEOUT", "60"))
+# Batas waktu menunggu satu job OCR selesai (termasuk antrian di service OCR)
+OCR_JOB_TIMEOUT = float(os.getenv("OCR_JOB_TIMEOUT", "900"))
+# Jeda sebelum job penilaian yang menunggu OCR diambil lagi oleh worker
+OCR_POLL_INTERVAL = float(os.getenv("OCR_POLL_INTERVAL", "5"))
+OCR_UPLOAD_DIR = os.getenv("OCR_UPLOAD_DIR", "uploads/ocr")
+MAX_FILE_SIZE = 50 * 1024 * 1024
+
+
+class OCRJobNotFoundError(RuntimeError):
+    # Job tidak dikenal service OCR (misalnya service di-restart sebelum hasil diambil)
+    pass
+
+
+class OCRPendingError(RuntimeError):
+    # OCR belum selesai: job penilaian dikembalikan ke antrian, bukan menunggu di worker
+    def __init__(self, message: str, retry_after: float = OCR_POLL_INTERVAL):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def save_ocr_upload(content: bytes, assignment_id: int, student_id: int, filename: str) -> str:
+    os.makedirs(OCR_UPLOAD_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    original_filename = os.path.basename(filename).replace(" ", "_")
+    file_path = os.path.join(OCR_UPLOAD_DIR, f"{assignment_id}-{student_id}-{timestamp}_{original_filename}")
+    with open(file_path, "wb") as f:
+        f.write(content)
+    return file_path
+
+
+def _request_timeout() -> httpx.Timeout:
+    return httpx.Timeout(OCR_REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+async def submit_ocr_job(content: bytes, filename: str, owner: Optional[str] = None) -> Dict:
+    # owner disimpan di job OCR agar hanya pengunggahnya yang bisa membaca hasilnya lewat API
+    try:
+        response = await get_http_client().post(
+            f"{OCR_SERVICE_URL}/ocr",
+            files={"file": (filename, content, "application/pdf")},
+            data={"owner": owner} if owner else None,
+            timeout=_request_timeout()
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        raise RuntimeError("Upload ke service OCR melebihi batas waktu.")
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Gagal mengirim file ke service OCR: {e}")
+
+
+async def get_ocr_job(job_id: str) -> Dict:
+    try:
+        response = await get_http_client().get(f"{OCR_SERVICE_URL}/ocr/{job_id}", timeout=_request_timeout())
+        if response.status_code == 404:
+            raise OCRJobNotFoundError(f"Job OCR {job_id} tidak ditemukan di service OCR")
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        raise RuntimeError("Permintaan status ke service OCR melebihi batas waktu.")
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Gagal mengambil status job OCR {job_id}: {e}")
+
+
+async def submit_ocr_file(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        content = f.read()
+    submitted = await submit_ocr_job(content, os.path.basename(file_path))
+    print(f"[OCR] File {file_path} dikirim ke service OCR (job {submitted['job_id']})")
+    return submitted["job_id"]
+
+
+def map_answers_to_questions(answers: List[str], num_questions: int) -> List[str]:
+    """
+    Kotak jawaban dibaca berurutan (halaman lalu kotak) dan dipetakan ke soal sesuai question_order.
+    Kotak yang kurang menjadi jawaban kosong; kotak berlebih digabung ke jawaban soal terakhir.
+    """
+    if num_questions <= 0:
+        return []
+    mapped = list(answers[:num_questions]) + [""] * max(0, num_questions - len(answers))
+    if len(answers) > num_questions:
+        mapped[-1] = "\n".join([mapped[-1], *answers[num_questions:]]).strip()
+    return mapped
+
+
+async def _reset_ocr_job(db: AsyncSession, submission: AssignmentSubmission) -> None:
+    # Retry penilaian berikutnya mengirim ulang file ke service OCR
+    submission.ocr_job_id = None # type: ignore
+    submission.ocr_requested_at = None # type: ignore
+    await db.commit()
+
+
+async def extract_ocr_answers(db: AsyncSession, submission: AssignmentSubmission) -> None:
+    """
+    OCR file submission lewat service OCR lalu simpan jawabannya sebagai QuestionAnswer.
+    Membutuhkan submission.assignment.questions dan submission.question_answers sudah dimuat.
+    Tidak menunggu OCR selesai: selama job OCR masih berjalan, OCRPendingError dilempar agar
+    job penilaian dijadwalkan ulang. Di-commit sendiri agar retry penilaian tidak mengulang OCR.
+    """
+    if not submission.file_path:
+        raise RuntimeError(f"Submission OCR {submission.id} tidak punya file")
+
+    if submission.ocr_job_id is None:
+        submission.ocr_job_id = await submit_ocr_file(submission.file_path) # type: ignore
+        submission.ocr_requested_at = datetime.utcnow() # type: ignore
+        await db.commit()
+        raise OCRPendingError(f"Job OCR {submission.ocr_job_id} baru dikirim")
+
+    try:
+        job = await get_ocr_job(submission.ocr_job_id) # type: ignore
+    except OCRJobNotFoundError:
+        await _reset_ocr_job(db, submission)
+        raise
+
+    if job["status"] == "failed":
+        await _reset_ocr_job(db, submission)
+        raise RuntimeError(f"OCR gagal: {job.get('error')}")
+    if job["status"] != "done":
+        waited = (datetime.utcnow() - submission.ocr_requested_at).total_seconds() # type: ignore
+        if waited >= OCR_JOB_TIMEOUT:
+            job_id = submission.ocr_job_id
+            await _reset_ocr_job(db, submission)
+            raise RuntimeError(f"Job OCR {job_id} belum selesai setelah {OCR_JOB_TIMEOUT} detik")
+        raise OCRPendingError(f"Job OCR {submission.ocr_job_id} masih {job['status']}")
+
+    questions = submission.assignment.questions
+    answers = map_answers_to_questions(job["answers"], len(questions))
+    if len(job["answers"]) != len(questions):
+        print(f"[OCR] Submission {submission.id}: {len(job['answers'])} kotak jawaban untuk {len(questions)} soal")
+
+    for question, answer_text in zip(questions, answers):
+        submission.question_answers.append(
+            QuestionAnswer(submission_id=submission.id, question_id=question.id, answer_text=answer_text)
+        )
+    await db.commit()
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional
+import time
+from models.question import Question
+from services.grading_tunneling import embed_texts_via_tunnel
+
+# Lama versi model embedding dan template prompt grader disimpan sebelum ditanyakan ulang
+GRADER_VERSION_TTL = 300
+
+_grader_versions: Optional[Dict] = None
+_grader_versions_at = 0.0
+
+
+def invalidate_question_artifacts(question: Question) -> None:
+    # Dipanggil setiap reference_answer berubah; artefak lama tidak lagi sesuai
+    # prompt_type hanya berasal dari grader (/embed); selama NULL grader mendeteksinya sendiri
+    question.prompt_type = None # type: ignore
+    question.answer_key_embedding = None # type: ignore
+    question.prompt_version = None # type: ignore
+
+
+def _remember_grader_versions(result: Dict) -> Dict:
+    global _grader_versions, _grader_versions_at
+    _grader_versions = {"embedding_model": result["embedding_model"], "prompt_version": result["prompt_version"]}
+    _grader_versions_at = time.time()
+    return _grader_versions
+
+
+async def get_grader_versions() -> Optional[Dict]:
+    # /embed dengan daftar teks kosong hanya mengembalikan versi tanpa menghitung embedding
+    if _grader_versions is not None and time.time() - _grader_versions_at < GRADER_VERSION_TTL:
+        return _grader_versions
+    try:
+        return _remember_grader_versions(await embed_texts_via_tunnel([]))
+    except RuntimeError as e:
+        print(f"⚠️ Versi grader tidak bisa diambil: {e}")
+        return None
+
+
+def artifacts_outdated(question: Question, versions: Optional[Dict]) -> bool:
+    if question.answer_key_embedding is None:
+        return True
+    if versions is None:
+        return False
+    return (
+        question.answer_key_embedding.get("model") != versions["embedding_model"] # type: ignore
+        or question.prompt_version != versions["prompt_version"]
+    )
+
+
+async def refresh_question_artifacts(questions: List[Question]) -> int:
+    """
+    Lengkapi embedding kunci jawaban, tipe prompt, dan versi prompt dari grader untuk soal
+    yang belum punya artefak atau artefaknya dibuat model embedding/versi prompt lain.
+    Gagal tidak fatal: grader tetap menghitung sendiri saat menilai.
+    """
+    if not questions:
+        return 0
+    versions = await get_grader_versions()
+    pending = [q for q in questions if artifacts_outdated(q, versions)]
+    if not pending:
+        return 0
+
+    try:
+        result = await embed_texts_via_tunnel([q.reference_answer for q in pending]) # type: ignore
+    except RuntimeError as e:
+        print(f"⚠️ Artefak soal tidak dihitung, penilaian tetap berjalan tanpa artefak: {e}")
+        return 0
+
+    _remember_grader_versions(result)
+    for question, vector, prompt_type in zip(pending, result["embeddings"], result["prompt_types"]):
+        question.answer_key_embedding = {"model": result["embedding_model"], "vector": vector} # type: ignore
+        question.prompt_type = prompt_type # type: ignore
+        question.prompt_version = result["prompt_version"] # type: ignore
+    return len(pending)
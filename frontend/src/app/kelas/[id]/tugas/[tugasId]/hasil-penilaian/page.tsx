@@ -2,6 +2,7 @@
 
 import { useRouter, useParams } from "next/navigation";
 import { useEffect, useState } from "react";
+import { useQueryClient } from "@tanstack/react-query";
 import ProtectedRoute from "@/components/ProtectedRoute";
 import Navbar from "@/components/Navbar";
 import LoadingSpinner from "@/components/LoadingSpinner";
@@ -13,6 +14,7 @@ import {
 	useAssignmentStatistics,
 	useAssignmentGrades,
 	useAutoGradeAllSubmissions,
+	useAutoGradeAllStatus,
 } from "@/hooks/useGrading";
 import toast, { Toaster } from "react-hot-toast";
 import { ArrowLeft, Books, Play, DownloadSimple } from "phosphor-react";
@@ -38,34 +40,45 @@ function HasilPenilaianContent() {
 	const { data: statistics } = useAssignmentStatistics(assignmentId);
 	const { data: grades, isLoading: isLoadingGrades } =
 		useAssignmentGrades(assignmentId);
+	const queryClient = useQueryClient();
 	const autoGradeAll = useAutoGradeAllSubmissions();
 	const [showAutoGradeModal, setShowAutoGradeModal] = useState(false);
-	const [isGrading, setIsGrading] = useState(false);
+	// Waktu mulai memantau antrian; progres yang diambil sebelum waktu ini diabaikan
+	const [gradingStartedAt, setGradingStartedAt] = useState<number | null>(null);
+	const isGrading = gradingStartedAt !== null;
+	const { data: gradingStatus, dataUpdatedAt: gradingStatusUpdatedAt } =
+		useAutoGradeAllStatus(assignmentId, isGrading);
+
 	useEffect(() => {
-		const gradingKey = `grading_${assignmentId}`;
-		const isGradingStored = sessionStorage.getItem(gradingKey);
-		if (isGradingStored === 'true') {
-			setIsGrading(true);
-			toast.loading("Proses penilaian masih berlangsung...", {
+		// Antrian masih berjalan saat halaman dibuka (reload atau tab lain): lanjutkan pemantauan
+		if (!isGrading && gradingStatus?.is_running) {
+			setGradingStartedAt(gradingStatusUpdatedAt);
+		}
+	}, [gradingStatus, gradingStatusUpdatedAt, isGrading]);
+
+	useEffect(() => {
+		if (gradingStartedAt === null || !gradingStatus || gradingStatusUpdatedAt < gradingStartedAt) {
+			return;
+		}
+
+		const finished = gradingStatus.done + gradingStatus.failed;
+		if (gradingStatus.is_running) {
+			toast.loading(`Menilai submission ${finished}/${gradingStatus.total_jobs}...`, {
 				id: 'grading-progress',
 				duration: Infinity,
 			});
+			return;
 		}
-	}, [assignmentId]);
 
-	useEffect(() => {
-		const gradingKey = `grading_${assignmentId}`;
-		if (!autoGradeAll.isPending && isGrading) {
-			const timer = setTimeout(() => {
-				sessionStorage.removeItem(gradingKey);
-				setIsGrading(false);
-				toast.dismiss('grading-progress');
-				toast.success("Proses penilaian selesai!");
-			}, 2000);
-			
-			return () => clearTimeout(timer);
+		setGradingStartedAt(null);
+		toast.dismiss('grading-progress');
+		queryClient.invalidateQueries({ queryKey: ["grading"] });
+		if (gradingStatus.failed > 0) {
+			toast.error(`Penilaian selesai, ${gradingStatus.failed} submission gagal dinilai`);
+		} else {
+			toast.success("Proses penilaian selesai!");
 		}
-	}, [autoGradeAll.isPending, isGrading, assignmentId]);
+	}, [gradingStatus, gradingStatusUpdatedAt, gradingStartedAt, queryClient]);
 
 	useEffect(() => {
 		if (user && user.user_role !== "dosen") {
@@ -86,24 +99,21 @@ function HasilPenilaianContent() {
 
 	const handleAutoGradeAll = async () => {
 		setShowAutoGradeModal(false);
-		const gradingKey = `grading_${assignmentId}`;
 		try {
-			sessionStorage.setItem(gradingKey, 'true');
-			setIsGrading(true);
-			
-			toast.loading("Memulai proses penilaian otomatis...", {
+			toast.loading("Memasukkan submission ke antrian penilaian...", {
 				id: 'grading-progress',
 				duration: Infinity,
 			});
-			
-			await autoGradeAll.mutateAsync(assignmentId);
-			sessionStorage.removeItem(gradingKey);
-			setIsGrading(false);
-			toast.dismiss('grading-progress');
+
+			const result = await autoGradeAll.mutateAsync(assignmentId);
+			if (result.queued + result.already_queued > 0) {
+				// Endpoint hanya mengantrikan job; pantau /status sampai antrian selesai
+				setGradingStartedAt(Date.now());
+			} else {
+				toast.dismiss('grading-progress');
+			}
 		} catch (error) {
 			console.error("Error auto-grading:", error);
-			sessionStorage.removeItem(gradingKey);
-			setIsGrading(false);
 			toast.dismiss('grading-progress');
 		}
 	};
@@ -11,6 +11,7 @@ import Textarea from "@/components/Textarea";
 import ConfirmModal from "@/components/ConfirmModal";
 import { useAuth } from "@/context/AuthContext";
 import { assignmentService } from "@/services";
+import { useMyGradingStatus, isGradingInProgress } from "@/hooks/useAssignments";
 import {
 	ArrowLeft,
 	Books,
@@ -83,6 +84,22 @@ function AssignmentDetailContent() {
 		queryFn: () => assignmentService.getMySubmission(assignmentId),
 		enabled: user?.user_role === "mahasiswa",
 	});
+	// Submission dinilai di background: pantau status sampai Nilai siap atau penilaian gagal
+	const isWaitingForGrade = isGradingInProgress(mySubmission?.grading_status);
+	const { data: myGradingStatus } = useMyGradingStatus(assignmentId, isWaitingForGrade);
+	useEffect(() => {
+		if (!isWaitingForGrade || !myGradingStatus) return;
+		if (myGradingStatus.grading_status === "graded") {
+			toast.success("Nilai Anda sudah tersedia!");
+		} else if (myGradingStatus.grading_status === "grading_failed") {
+			toast.error("Penilaian otomatis gagal, tugas akan dinilai ulang oleh dosen");
+		} else {
+			return;
+		}
+		queryClient.invalidateQueries({
+			queryKey: ["mySubmission", assignmentId],
+		});
+	}, [myGradingStatus, isWaitingForGrade, queryClient, assignmentId]);
 	useEffect(() => {
 		const hasSubmitted = mySubmission?.submitted || false;
 		if (!hasSubmitted && answers.length > 0) {
@@ -181,7 +198,7 @@ function AssignmentDetailContent() {
 			sessionStorage.removeItem(storageKey);
 			sessionStorage.removeItem(submittingKey);
 			toast.dismiss('submitting-progress');
-			toast.success("Jawaban berhasil dikumpulkan!");
+			toast.success("Jawaban berhasil dikumpulkan, penilaian sedang diproses");
 			queryClient.invalidateQueries({
 				queryKey: ["mySubmission", assignmentId],
 			});
@@ -212,6 +229,7 @@ function AssignmentDetailContent() {
 	const isTeacher = user?.user_role === "dosen";
 	const hasSubmitted = mySubmission?.submitted || false;
 	const isGraded = mySubmission?.graded || false;
+	const isGradingFailed = mySubmission?.grading_status === "grading_failed";
 	const [isAssignmentMenuOpen, setIsAssignmentMenuOpen] = useState(false);
 	const [isDeletingAssignment, setIsDeletingAssignment] = useState(false);
 	const [showDeleteModal, setShowDeleteModal] = useState(false);
@@ -521,7 +539,9 @@ function AssignmentDetailContent() {
 										<p className="text-white/90 text-sm mb-3 underline">
 											{isGraded
 												? "Jawaban tidak bisa diubah lagi"
-												: "Sedang dinilai secara otomatis oleh sistem AI..."}
+												: isGradingFailed
+													? "Penilaian otomatis gagal, menunggu dinilai ulang oleh dosen"
+													: "Sedang dinilai secara otomatis oleh sistem AI..."}
 										</p>
 									</div>
 									{isGraded && (
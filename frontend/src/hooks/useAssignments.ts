@@ -6,6 +6,7 @@ import {
 	CreateAssignmentRequest,
 	UpdateAssignmentRequest,
 	SubmitAnswerRequest,
+	GradingStatus,
 } from "@/types";
 import toast from "react-hot-toast";
 
@@ -15,8 +16,16 @@ export const assignmentKeys = {
 	detail: (id: number) => ["assignments", id] as const,
 	submissions: (id: number) => ["assignments", id, "submissions"] as const,
 	mySubmission: (id: number) => ["assignments", id, "my-submission"] as const,
+	myGradingStatus: (id: number) => ["assignments", id, "my-submission", "grading-status"] as const,
 };
 
+// Interval polling status penilaian submission mahasiswa selama masih di antrian
+const GRADING_STATUS_POLL_INTERVAL = 3000;
+
+export function isGradingInProgress(status?: GradingStatus) {
+	return status === "grading_pending" || status === "grading_running";
+}
+
 export function useClassAssignments(classId: number) {
 	return useQuery({
 		queryKey: assignmentKeys.byClass(classId),
@@ -49,6 +58,15 @@ export function useMySubmission(assignmentId: number) {
 	});
 }
 
+export function useMyGradingStatus(assignmentId: number, polling: boolean) {
+	return useQuery({
+		queryKey: assignmentKeys.myGradingStatus(assignmentId),
+		queryFn: () => assignmentService.getMyGradingStatus(assignmentId),
+		enabled: !!assignmentId && polling,
+		refetchInterval: polling ? GRADING_STATUS_POLL_INTERVAL : false,
+	});
+}
+
 export function useCreateAssignment() {
 	const queryClient = useQueryClient();
 
@@ -122,13 +140,14 @@ export function useSubmitTypedAnswer() {
 			data: SubmitAnswerRequest;
 		}) => assignmentService.submitTypedAnswer(assignmentId, data),
 		onSuccess: (_, variables) => {
+			// Penilaian berjalan di background; hasilnya dipantau lewat useMyGradingStatus
 			queryClient.invalidateQueries({
 				queryKey: assignmentKeys.mySubmission(variables.assignmentId),
 			});
 			queryClient.invalidateQueries({
 				queryKey: assignmentKeys.submissions(variables.assignmentId),
 			});
-			toast.success("Jawaban berhasil dikirim!");
+			toast.success("Jawaban berhasil dikirim, penilaian sedang diproses");
 		},
 		onError: (error: Error) => {
 			toast.error(error.message || "Gagal mengirim jawaban");
@@ -148,13 +167,14 @@ export function useSubmitOCRAnswer() {
 			file: File;
 		}) => assignmentService.submitOCRAnswer(assignmentId, file),
 		onSuccess: (_, variables) => {
+			// OCR dan penilaian berjalan di background, sama seperti jawaban ketik
 			queryClient.invalidateQueries({
 				queryKey: assignmentKeys.mySubmission(variables.assignmentId),
 			});
 			queryClient.invalidateQueries({
 				queryKey: assignmentKeys.submissions(variables.assignmentId),
 			});
-			toast.success("File berhasil dikirim!");
+			toast.success("File berhasil dikirim, OCR dan penilaian sedang diproses");
 		},
 		onError: (error: Error) => {
 			toast.error(error.message || "Gagal mengirim file");
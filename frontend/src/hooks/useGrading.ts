@@ -8,8 +8,12 @@ export const gradingKeys = {
   grades: (assignmentId: number) => ["grading", "grades", assignmentId] as const,
   studentGrades: (studentId: number) => ["grading", "student", studentId] as const,
   exportData: (assignmentId: number) => ["grading", "export", assignmentId] as const,
+  autoGradeAllStatus: (assignmentId: number) => ["grading", "auto-grade-all", assignmentId] as const,
 };
 
+// Interval polling progres penilaian selama job masih berjalan di antrian
+const AUTO_GRADE_POLL_INTERVAL = 3000;
+
 export function useAssignmentStatistics(assignmentId: number) {
   return useQuery({
     queryKey: gradingKeys.statistics(assignmentId),
@@ -70,9 +74,14 @@ export function useAutoGradeAllSubmissions() {
 
   return useMutation({
     mutationFn: (assignmentId: number) => gradingService.autoGradeAllSubmissions(assignmentId),
-    onSuccess: () => {
-      queryClient.invalidateQueries({ queryKey: ["grading"] });
-      toast.success("Penilaian otomatis untuk semua jawaban berhasil!");
+    onSuccess: (data, assignmentId) => {
+      // Penilaian berjalan di background; hasilnya dipantau lewat useAutoGradeAllStatus
+      queryClient.invalidateQueries({ queryKey: gradingKeys.autoGradeAllStatus(assignmentId) });
+      if (data.queued + data.already_queued > 0) {
+        toast.success(`${data.queued + data.already_queued} submission masuk antrian penilaian`);
+      } else {
+        toast.success("Semua submission sudah dinilai");
+      }
     },
     onError: (error: Error) => {
       toast.error(error.message || "Gagal melakukan penilaian otomatis");
@@ -80,6 +89,15 @@ export function useAutoGradeAllSubmissions() {
   });
 }
 
+export function useAutoGradeAllStatus(assignmentId: number, polling: boolean) {
+  return useQuery({
+    queryKey: gradingKeys.autoGradeAllStatus(assignmentId),
+    queryFn: () => gradingService.getAutoGradeAllStatus(assignmentId),
+    enabled: !!assignmentId,
+    refetchInterval: polling ? AUTO_GRADE_POLL_INTERVAL : false,
+  });
+}
+
 export function useDeleteGrade() {
   const queryClient = useQueryClient();
 
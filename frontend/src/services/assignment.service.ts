@@ -7,6 +7,8 @@ import {
   AssignmentDetailResponse,
   SubmissionResponse,
   MySubmissionResponse,
+  SubmitAnswerResponse,
+  GradingStatusResponse,
 } from "@/types";
 
 export const assignmentService = {
@@ -36,8 +38,8 @@ export const assignmentService = {
   submitTypedAnswer: async (
     assignmentId: number,
     data: SubmitAnswerRequest
-  ): Promise<{ message: string; submission_id: number }> => {
-    return apiClient.post<{ message: string; submission_id: number }>(
+  ): Promise<SubmitAnswerResponse> => {
+    return apiClient.post<SubmitAnswerResponse>(
       `/api/assignments/${assignmentId}/submit/typing`,
       data
     );
@@ -46,15 +48,14 @@ export const assignmentService = {
   submitOCRAnswer: async (
     assignmentId: number,
     file: File
-  ): Promise<{ message: string; submission_id: number; extracted_text: string }> => {
+  ): Promise<SubmitAnswerResponse> => {
     const formData = new FormData();
     formData.append("file", file);
 
-    return apiClient.uploadFile<{
-      message: string;
-      submission_id: number;
-      extracted_text: string;
-    }>(`/api/assignments/${assignmentId}/submit/ocr`, formData);
+    return apiClient.uploadFile<SubmitAnswerResponse>(
+      `/api/assignments/${assignmentId}/submit/ocr`,
+      formData
+    );
   },
 
   getAssignmentSubmissions: async (assignmentId: number): Promise<SubmissionResponse[]> => {
@@ -65,6 +66,12 @@ export const assignmentService = {
     return apiClient.get<MySubmissionResponse>(`/api/assignments/${assignmentId}/my-submission`);
   },
 
+  getMyGradingStatus: async (assignmentId: number): Promise<GradingStatusResponse> => {
+    return apiClient.get<GradingStatusResponse>(
+      `/api/assignments/${assignmentId}/my-submission/grading-status`
+    );
+  },
+
   cancelMySubmission: async (assignmentId: number): Promise<{ message: string }> => {
     return apiClient.delete<{ message: string }>(`/api/assignments/${assignmentId}/my-submission`);
   },
@@ -4,6 +4,7 @@ import {
   NilaiResponse,
   AutoGradeResponse,
   AutoGradeAllResponse,
+  AutoGradeAllStatusResponse,
   AssignmentStatisticsResponse,
   SubmissionDetailResponse,
   ExcelExportData,
@@ -34,6 +35,12 @@ export const gradingService = {
     );
   },
 
+  getAutoGradeAllStatus: async (assignmentId: number): Promise<AutoGradeAllStatusResponse> => {
+    return apiClient.get<AutoGradeAllStatusResponse>(
+      `/api/grading/assignments/${assignmentId}/auto-grade-all/status`
+    );
+  },
+
   getAssignmentStatistics: async (assignmentId: number): Promise<AssignmentStatisticsResponse> => {
     return apiClient.get<AssignmentStatisticsResponse>(
       `/api/grading/assignments/${assignmentId}/statistics`
@@ -217,9 +217,36 @@ export interface SubmissionResponse {
     score?: number;
 }
 
+export type GradingStatus =
+    | "not_graded"
+    | "grading_pending"
+    | "grading_running"
+    | "graded"
+    | "grading_failed";
+
+export interface SubmitAnswerResponse {
+    message: string;
+    submission_id: number;
+    grading_status: GradingStatus;
+    job_id?: number;
+}
+
+export interface GradingStatusResponse {
+    submission_id: number;
+    grading_status: GradingStatus;
+    job_id?: number;
+    attempts: number;
+    error?: string;
+    total_score?: number;
+    max_score?: number;
+    percentage?: number;
+    graded_at?: string;
+}
+
 export interface MySubmissionResponse {
     submitted: boolean;
     submission_id?: number;
+    grading_status?: GradingStatus;
     submission_type?: SubmissionType;
     submitted_at?: string;
     answers?: Array<{
@@ -299,7 +326,28 @@ export interface AutoGradeResponse {
 export interface AutoGradeAllResponse {
     message: string;
     total_submissions: number;
-    newly_graded: number;
+    up_to_date: number;
+    queued: number;
+    already_queued: number;
+    job_ids: number[];
+}
+
+export interface GradingJobFailure {
+    job_id: number;
+    submission_id: number;
+    error?: string;
+}
+
+export interface AutoGradeAllStatusResponse {
+    assignment_id: number;
+    total_jobs: number;
+    pending: number;
+    running: number;
+    done: number;
+    failed: number;
+    progress: number;
+    is_running: boolean;
+    failures: GradingJobFailure[];
 }
 
 export interface AssignmentStatisticsResponse {
@@ -0,0 +1,127 @@
+import multiprocessing
+import resource
+import statistics
+import time
+import pandas as pd
+
+from similarity_model_benchmark import ANSWER_KEY, STUDENT_ANSWERS
+
+# =========================================
+# ⚙️ Konfigurasi
+# =========================================
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+REPEAT = 20  # jumlah pengulangan encode per jawaban
+PARITY_THRESHOLD = 0.99
+
+# =========================================
+# 🧠 Backend yang akan diuji (semua di CPU)
+# =========================================
+BACKENDS = {
+    "torch": {},
+    "onnx": {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model.onnx"}},
+    "onnx-int8": {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_quint8_avx2.onnx"}},
+}
+
+# =========================================
+# 🧮 Fungsi Benchmark (dijalankan di proses terpisah agar memori per backend terukur)
+# =========================================
+def benchmark_backend(name: str) -> dict:
+    from sentence_transformers import SentenceTransformer
+
+    start_load = time.time()
+    model = SentenceTransformer(MODEL_ID, device="cpu", **BACKENDS[name])
+    load_time = (time.time() - start_load) * 1000
+
+    # Warmup
+    model.encode("warmup", convert_to_tensor=True)
+
+    emb_key = model.encode(ANSWER_KEY, convert_to_tensor=True, normalize_embeddings=True)
+
+    infer_times = []
+    embeddings = []
+    similarities = []
+    for ans in STUDENT_ANSWERS:
+        for _ in range(REPEAT):
+            start_infer = time.time()
+            emb_ans = model.encode(ans, convert_to_tensor=True, normalize_embeddings=True)
+            infer_times.append((time.time() - start_infer) * 1000)
+        embeddings.append(emb_ans.tolist())
+        similarities.append((emb_key * emb_ans).sum().item())
+
+    start_batch = time.time()
+    model.encode(STUDENT_ANSWERS, convert_to_tensor=True, normalize_embeddings=True)
+    batch_time = (time.time() - start_batch) * 1000
+
+    return {
+        "load_time": load_time,
+        "infer_mean": statistics.mean(infer_times),
+        "infer_p95": sorted(infer_times)[int(len(infer_times) * 0.95) - 1],
+        "batch_time": batch_time,
+        # ru_maxrss dalam KB di Linux
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "embeddings": embeddings,
+        "similarities": similarities,
+    }
+
+
+def cosine(a: list, b: list) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+# =========================================
+# 🚀 Main Benchmarking Loop
+# =========================================
+if __name__ == "__main__":
+    print(f"🧠 Benchmarking backend embedding {MODEL_ID} (CPU)...\n")
+    ctx = multiprocessing.get_context("spawn")
+
+    raw_results = {}
+    for name in BACKENDS:
+        print(f"🔍 Menguji backend: {name}")
+        try:
+            with ctx.Pool(1) as pool:
+                raw_results[name] = pool.apply(benchmark_backend, (name,))
+            print(f"✅ {name}: Infer={raw_results[name]['infer_mean']:.2f}ms, RSS={raw_results[name]['peak_rss']:.0f}MB")
+        except Exception as e:
+            print(f"❌ Gagal memproses {name}: {e}")
+
+    if "torch" not in raw_results:
+        raise SystemExit("❌ Backend torch gagal, parity check tidak bisa dilakukan.")
+    reference = raw_results["torch"]
+
+    summary_rows = []
+    case_rows = []
+    for name, res in raw_results.items():
+        parity = [cosine(a, b) for a, b in zip(reference["embeddings"], res["embeddings"])]
+        summary_rows.append({
+            "Backend": name,
+            "Load Time (ms)": round(res["load_time"], 2),
+            "Infer Mean (ms)": round(res["infer_mean"], 2),
+            "Infer p95 (ms)": round(res["infer_p95"], 2),
+            "Batch 6 (ms)": round(res["batch_time"], 2),
+            "Peak RSS (MB)": round(res["peak_rss"], 1),
+            "Speedup": round(reference["infer_mean"] / res["infer_mean"], 2),
+            "Min Cosine vs torch": round(min(parity), 6),
+            "Parity OK": min(parity) >= PARITY_THRESHOLD,
+        })
+        for idx, (sim, ref_sim) in enumerate(zip(res["similarities"], reference["similarities"]), 1):
+            case_rows.append({
+                "Backend": name,
+                "Student": f"Case {idx}",
+                "Similarity": round(sim, 4),
+                "Delta vs torch": round(sim - ref_sim, 4),
+            })
+
+    df_summary = pd.DataFrame(summary_rows)
+    df_cases = pd.DataFrame(case_rows)
+
+    # Tampilkan hasil
+    print("\n📊 HASIL PER STUDENT CASE:")
+    print(df_cases.to_string(index=False))
+    print("\n📊 LATENCY, MEMORI & PARITY PER BACKEND:")
+    print(df_summary.to_string(index=False))
+
+    # Simpan CSV
+    df_cases.to_csv("benchmark_backend_cases.csv", index=False)
+    df_summary.to_csv("benchmark_backend_summary.csv", index=False)
+    print("\n💾 CSV kasus siswa disimpan sebagai benchmark_backend_cases.csv")
+    print("💾 CSV ringkasan disimpan sebagai benchmark_backend_summary.csv")
@@ -1,18 +1,35 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+import time
+_IMPORT_STARTED_AT = time.time()
+
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import requests
 import json
 import re
-import time
-from typing import Optional
-import torch
-from sentence_transformers import SentenceTransformer, util
+import os
+import hashlib
+import sqlite3
+import threading
+import queue
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import List, Optional
 import textwrap
 
 # === Konfigurasi ===
 OLLAMA_URL = "http://localhost:11434/api/generate"
+# Pool endpoint Ollama, dipisah koma (base URL atau URL /api/generate). Default: OLLAMA_URL saja.
+OLLAMA_URLS = [u.strip() for u in os.getenv("OLLAMA_URLS", OLLAMA_URL).split(",") if u.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+# Request paralel per endpoint Ollama (samakan dengan OLLAMA_NUM_PARALLEL di server Ollama)
+OLLAMA_PARALLEL_PER_ENDPOINT = max(1, int(os.getenv("OLLAMA_PARALLEL_PER_ENDPOINT", "4")))
+# Panggilan LLM bersamaan dalam satu /grade/batch, sebanding dengan kapasitas pool endpoint
+LLM_BATCH_CONCURRENCY = max(1, len(OLLAMA_URLS) * OLLAMA_PARALLEL_PER_ENDPOINT)
 # DEFAULT_MODEL = "mistral:7b-instruct"
 # DEFAULT_MODEL = "llama3.2:3b"
 # DEFAULT_MODEL = "llama3.2:1b"
@@ -26,10 +43,74 @@ DEFAULT_MODEL = "qwen2.5:3b-instruct"
 
 # Nama model MiniLM (biar cache otomatis sesuai user)
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-DEVICE_MODE = "cuda" if torch.cuda.is_available() else "cpu"
+# Model embedding (dan torch) baru dimuat saat dibutuhkan; preload berjalan di background saat startup
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "true").lower() == "true"
+# Backend embedding: "torch" (PyTorch), "onnx" (ONNX Runtime fp32), atau "onnx-int8" (ONNX Runtime terkuantisasi)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Identitas embedding; vektor kunci jawaban dari backend hanya dipakai jika identitasnya sama
+EMBEDDING_MODEL_ID = f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}"
+EMBEDDING_ONNX_FILES = {
+    "onnx": os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx"),
+    "onnx-int8": os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx"),
+}
+# Bandingkan embedding backend ONNX dengan PyTorch saat model dimuat (memuat model PyTorch sekali)
+EMBEDDING_PARITY_CHECK = os.getenv("EMBEDDING_PARITY_CHECK", "false").lower() == "true"
+EMBEDDING_PARITY_THRESHOLD = float(os.getenv("EMBEDDING_PARITY_THRESHOLD", "0.99"))
+# Micro-batching encode: request yang datang dalam jendela MICROBATCH_WAIT_MS digabung jadi satu forward pass
+MICROBATCH_WAIT_MS = float(os.getenv("MICROBATCH_WAIT_MS", "5"))
+MICROBATCH_MAX_SIZE = max(1, int(os.getenv("MICROBATCH_MAX_SIZE", "64")))
+# Batas waktu menunggu hasil encode (termasuk antrian dan lazy load model) sebelum request gagal
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+# Worker proses embedding: 0 = encode di proses server, "auto" = setengah jumlah core (min 1)
+CPU_COUNT = os.cpu_count() or 1
+_embedding_workers_env = os.getenv("EMBEDDING_WORKERS", "0").lower()
+EMBEDDING_WORKERS = max(1, CPU_COUNT // 2) if _embedding_workers_env == "auto" else max(0, int(_embedding_workers_env))
+# Thread torch per worker; default membagi core secara merata agar worker tidak saling berebut
+EMBEDDING_TORCH_THREADS = int(os.getenv("EMBEDDING_TORCH_THREADS", "0")) or max(1, CPU_COUNT // max(1, EMBEDDING_WORKERS))
+
+# Cache embedding kunci jawaban (LRU + TTL)
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("ANSWER_KEY_CACHE_SIZE", "1024"))
+ANSWER_KEY_CACHE_TTL = float(os.getenv("ANSWER_KEY_CACHE_TTL", "3600"))
+
+# Cache hasil penilaian (persisten, SQLite). Naikkan PROMPT_VERSION setiap template prompt berubah.
+PROMPT_VERSION = "v2"
+GRADE_CACHE_ENABLED = os.getenv("GRADE_CACHE_ENABLED", "true").lower() == "true"
+GRADE_CACHE_PATH = os.getenv("GRADE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "grade_cache.sqlite3"))
+GRADER_ADMIN_TOKEN = os.getenv("GRADER_ADMIN_TOKEN")
+
+# Streaming Ollama: berhenti begitu objek JSON rubrik lengkap sudah diterima
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "true").lower() == "true"
+RUBRIC_KEYS = ("pemahaman", "kelengkapan", "kejelasan", "analisis", "feedback")
+
+# Structured output Ollama: "schema" (JSON schema rubrik), "json" (JSON bebas), atau "none"
+OLLAMA_FORMAT = os.getenv("OLLAMA_FORMAT", "schema").lower()
+# Jumlah maksimum percobaan perbaikan jika output model bukan JSON rubrik valid
+OLLAMA_REPAIR_RETRIES = max(0, int(os.getenv("OLLAMA_REPAIR_RETRIES", "1")))
+RUBRIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pemahaman": {"type": "number", "minimum": 0, "maximum": 100},
+        "kelengkapan": {"type": "number", "minimum": 0, "maximum": 100},
+        "kejelasan": {"type": "number", "minimum": 0, "maximum": 100},
+        "analisis": {"type": "number", "minimum": 0, "maximum": 100},
+        "feedback": {"type": "string"},
+    },
+    "required": list(RUBRIC_KEYS),
+}
 
 # === Inisialisasi Aplikasi ===
-app = FastAPI(title="Ollama Essay Auto Grader", version="0.3")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    OLLAMA_ROUTER.start_health_checks()
+    if EMBEDDING_PRELOAD:
+        # Warm-up di thread terpisah supaya server langsung menerima request (/health, /ready)
+        threading.Thread(target=warmup_models, name="warmup", daemon=True).start()
+    yield
+    LLM_EXECUTOR.shutdown(wait=False)
+    EMBEDDING_POOL.shutdown()
+
+
+app = FastAPI(title="Ollama Essay Auto Grader", version="0.3", lifespan=lifespan)
 
 # === Schema Request ===
 class GradeRequest(BaseModel):
@@ -37,15 +118,31 @@ class GradeRequest(BaseModel):
     answer_key: str
     student_answer: str
     model: Optional[str] = DEFAULT_MODEL
+    prompt_type: Optional[str] = None
+    answer_key_embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
 
+class GradeBatchItem(BaseModel):
+    question: str
+    answer_key: str
+    student_answer: str
+    prompt_type: Optional[str] = None
+    answer_key_embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
+
+class GradeBatchRequest(BaseModel):
+    items: List[GradeBatchItem]
+    model: Optional[str] = DEFAULT_MODEL
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
 
-# === 1️⃣ Prompt Rubric-based ===
-def build_prompt(question: str, answer_key: str, student_answer: str) -> str:
-    # handle blank answer
-    if not student_answer or not student_answer.strip():
-        student_answer = "(jawaban kosong)"
 
-    default_prompt = f"""
+# === 1️⃣ Prompt Rubric-based ===
+# Template dikompilasi sekali saat import; per request hanya substitusi string.
+# Naikkan PROMPT_VERSION setiap isi template berubah.
+PROMPT_TEMPLATES = {
+    "essay": """
 Anda adalah sistem penilai jawaban esai otomatis.
 Tugas Anda adalah menilai jawaban mahasiswa berdasarkan rubrik berikut secara objektif dan konsisten.
 
@@ -89,9 +186,8 @@ Keluarkan hasil dalam format JSON berikut:
   "analisis": float,
   "feedback": string
 }}
-"""
-
-    coder_prompt = f"""
+""",
+    "code": """
 Anda adalah sistem penilai jawaban esai pemrograman otomatis.
 Tugas Anda adalah menilai kualitas jawaban mahasiswa berdasarkan rubrik berikut **secara objektif, konsisten, dan berbasis bukti dari kode dan penjelasan**.
 
@@ -153,50 +249,332 @@ Jawaban Mahasiswa:
   "analisis": float,       # skor 0–100
   "feedback": string       # maksimal 3 kalimat, fokus ke aspek penting
 }}
-"""
+""",
+}
+PROMPT_TYPES = tuple(PROMPT_TEMPLATES)
 
-    # Cek code di dalam answer_key
-    code_indicators = [
-        r"```", r";", r"\{", r"\}", r"\bfunction\b", r"\bclass\b",
-        r"\bpublic\b", r"\bprivate\b", r"::", r"->", r"==", r"!=",
-        r"\.php\b", r"\.js\b", r"\.py\b"
-    ]
+# Indikator kode di kunci jawaban, digabung menjadi satu regex
+CODE_INDICATORS = [
+    r"```", r";", r"\{", r"\}", r"\bfunction\b", r"\bclass\b",
+    r"\bpublic\b", r"\bprivate\b", r"::", r"->", r"==", r"!=",
+    r"\.php\b", r"\.js\b", r"\.py\b"
+]
+CODE_PATTERN = re.compile("|".join(CODE_INDICATORS))
 
-    is_code = any(re.search(p, answer_key) for p in code_indicators)
 
-    if is_code:
-        prompt = coder_prompt
+def detect_prompt_type(answer_key: str) -> str:
+    return "code" if CODE_PATTERN.search(answer_key) else "essay"
+
+
+def resolve_prompt_type(prompt_type: Optional[str], answer_key: str) -> str:
+    # prompt_type dari backend (disimpan per soal) dipakai langsung; selain itu dideteksi dari kunci jawaban
+    return prompt_type if prompt_type in PROMPT_TEMPLATES else detect_prompt_type(answer_key)
+
+
+def build_prompt(question: str, answer_key: str, student_answer: str, prompt_type: Optional[str] = None) -> str:
+    # handle blank answer
+    if not student_answer or not student_answer.strip():
+        student_answer = "(jawaban kosong)"
+
+    prompt_type = resolve_prompt_type(prompt_type, answer_key)
+    if prompt_type == "code":
         print("🛠️ Menggunakan prompt khusus Coder untuk penilaian jawaban pemrograman.")
     else:
-        prompt = default_prompt
         print("📝 Menggunakan prompt standar untuk penilaian jawaban esai.")
-    return prompt
+    return PROMPT_TEMPLATES[prompt_type].format(question=question, answer_key=answer_key, student_answer=student_answer)
 
 
 # === 2️⃣ Panggil Ollama ===
-def call_ollama(prompt: str, model: str = DEFAULT_MODEL, timeout: int = 90) -> dict:
+class JsonObjectDetector:
+    """Mendeteksi objek JSON rubrik pertama yang seimbang dari potongan teks streaming."""
+
+    def __init__(self):
+        self.text = ""
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._closing_quote = '"'
+        self._escaped = False
+        self._pos = 0
+
+    def feed(self, chunk: str) -> Optional[str]:
+        self.text += chunk
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == self._closing_quote:
+                    self._in_string = False
+                continue
+            if ch in ('"', "“"):
+                if self._depth > 0:
+                    self._in_string = True
+                    self._closing_quote = '"' if ch == '"' else "”"
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = self._pos - 1
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.text[self._start:self._pos]
+                    if self._is_rubric(candidate):
+                        return candidate
+        return None
+
+    @staticmethod
+    def _is_rubric(candidate: str) -> bool:
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            try:
+                parsed = safe_json_parse(candidate)
+            except ValueError:
+                return False
+        return isinstance(parsed, dict) and all(k in parsed for k in RUBRIC_KEYS)
+
+
+class LLMStats:
+    def __init__(self):
+        self.requests = 0
+        self.early_stops = 0
+        self.total_ttft = 0.0
+        self.total_tokens_per_sec = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ttft: Optional[float], tokens_per_sec: Optional[float], early_stop: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.early_stops += int(early_stop)
+            self.total_ttft += ttft or 0.0
+            self.total_tokens_per_sec += tokens_per_sec or 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.requests
+            return {
+                "stream_requests": n,
+                "early_stops": self.early_stops,
+                "avg_ttft": round(self.total_ttft / n, 3) if n else 0.0,
+                "avg_tokens_per_sec": round(self.total_tokens_per_sec / n, 2) if n else 0.0,
+            }
+
+
+LLM_STATS = LLMStats()
+
+
+# === 🔹 Router Multi-Endpoint Ollama ===
+class OllamaEndpoint:
+    def __init__(self, url: str):
+        base = url.rstrip("/")
+        if base.endswith("/api/generate"):
+            base = base[: -len("/api/generate")]
+        self.base_url = base
+        self.generate_url = f"{base}/api/generate"
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.avg_latency = None
+        self.last_error = None
+
+    def record_latency(self, latency: float) -> None:
+        # Exponential moving average supaya endpoint yang melambat cepat terlihat
+        self.avg_latency = latency if self.avg_latency is None else round(0.8 * self.avg_latency + 0.2 * latency, 3)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "avg_latency": self.avg_latency,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaRouter:
+    """Memilih endpoint sehat dengan beban paling kecil (request berjalan, lalu latency rata-rata)."""
+
+    def __init__(self, urls: List[str], health_interval: float):
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def acquire(self, exclude: tuple = ()) -> Optional[OllamaEndpoint]:
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            # Jika semua ditandai tidak sehat, tetap coba agar tidak macet karena status basi
+            healthy = [e for e in candidates if e.healthy] or candidates
+            endpoint = min(healthy, key=lambda e: (e.in_flight, e.avg_latency or 0.0))
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint, latency: Optional[float] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            if latency is not None:
+                endpoint.record_latency(latency)
+            if error is not None:
+                endpoint.failures += 1
+                endpoint.healthy = False
+                endpoint.last_error = error
+
+    def check_health(self) -> None:
+        for endpoint in self.endpoints:
+            try:
+                resp = requests.get(f"{endpoint.base_url}/api/tags", timeout=3)
+                healthy, error = resp.status_code == 200, None if resp.status_code == 200 else f"HTTP {resp.status_code}"
+            except requests.exceptions.RequestException as e:
+                healthy, error = False, str(e)
+            with self._lock:
+                endpoint.healthy = healthy
+                if error is not None:
+                    endpoint.last_error = error
+
+    def start_health_checks(self) -> None:
+        if self._health_thread is not None or self.health_interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.health_interval)
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [e.stats() for e in self.endpoints]
+
+
+OLLAMA_ROUTER = OllamaRouter(OLLAMA_URLS, OLLAMA_HEALTH_INTERVAL)
+LLM_EXECUTOR = ThreadPoolExecutor(max_workers=LLM_BATCH_CONCURRENCY, thread_name_prefix="llm-batch")
+
+
+def call_ollama_stream(url: str, payload: dict, timeout: int) -> dict:
+    payload = {**payload, "stream": True}
+    detector = JsonObjectDetector()
+    ttft = None
+    token_count = 0
+    first_token_at = None
+    early_stop = False
+    detected = None
+    final_chunk = {}
+
+    start_time = time.time()
+    with requests.post(url, json=payload, timeout=timeout, stream=True) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {resp.status_code} - {resp.text}")
+
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(f"Ollama API error: {chunk['error']}")
+            token = chunk.get("response", "")
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    ttft = round(first_token_at - start_time, 3)
+                token_count += 1
+                detected = detector.feed(token)
+                if detected is not None:
+                    # Keluar dari context manager menutup koneksi sehingga Ollama berhenti generate
+                    early_stop = True
+                    break
+            if chunk.get("done"):
+                final_chunk = chunk
+                break
+
+    end_time = time.time()
+    if final_chunk.get("eval_count") and final_chunk.get("eval_duration"):
+        tokens_per_sec = round(final_chunk["eval_count"] / (final_chunk["eval_duration"] / 1e9), 2)
+    elif first_token_at is not None and end_time > first_token_at:
+        tokens_per_sec = round(token_count / (end_time - first_token_at), 2)
+    else:
+        tokens_per_sec = None
+
+    LLM_STATS.record(ttft, tokens_per_sec, early_stop)
+    return {
+        # Jika objek rubrik terdeteksi, hanya objek itu yang diteruskan ke parser
+        "response": detected if detected is not None else detector.text,
+        "ttft": ttft,
+        "tokens_per_sec": tokens_per_sec,
+        "eval_count": final_chunk.get("eval_count", token_count),
+        "early_stop": early_stop,
+    }
+
+
+def get_output_format():
+    if OLLAMA_FORMAT == "schema":
+        return RUBRIC_SCHEMA
+    if OLLAMA_FORMAT == "json":
+        return "json"
+    return None
+
+
+def call_ollama(prompt: str, model: str = DEFAULT_MODEL, timeout: int = 90, stream: Optional[bool] = None, output_format=None) -> dict:
     payload = {
         "model": model,
         "prompt": prompt,
         "stream": False,
         "options": {"num_predict": 800, "temperature": 0.0}
     }
+    if output_format is not None:
+        payload["format"] = output_format
+
+    use_stream = OLLAMA_STREAM if stream is None else stream
+    tried = ()
+    last_error = None
+    while True:
+        endpoint = OLLAMA_ROUTER.acquire(exclude=tried)
+        if endpoint is None:
+            raise RuntimeError(f"Gagal terhubung ke Ollama API di {', '.join(OLLAMA_URLS)}: {last_error}")
+        tried += (endpoint,)
 
-    try:
         start_time = time.time()
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=timeout)
-        end_time = time.time()
-        llm_inference_time = round(end_time - start_time, 3)
-    except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"Gagal terhubung ke Ollama API di {OLLAMA_URL}: {e}")
-
-    if resp.status_code != 200:
-        raise RuntimeError(f"Ollama API error: {resp.status_code} - {resp.text}")
-
-    try:
-        return resp.json(), llm_inference_time # type: ignore
-    except ValueError:
-        return {"raw": resp.text}, llm_inference_time # type: ignore
+        try:
+            if use_stream:
+                result = call_ollama_stream(endpoint.generate_url, payload, timeout)
+            else:
+                resp = requests.post(endpoint.generate_url, json=payload, timeout=timeout)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"Ollama API error: {resp.status_code} - {resp.text}")
+                try:
+                    result = resp.json()
+                except ValueError:
+                    result = {"raw": resp.text}
+        except requests.exceptions.ConnectionError as e:
+            # Endpoint mati: tandai tidak sehat dan coba endpoint lain
+            OLLAMA_ROUTER.release(endpoint, error=str(e))
+            last_error = e
+            print(f"⚠️ Ollama di {endpoint.base_url} tidak dapat dihubungi, mencoba endpoint lain...")
+            continue
+        except requests.exceptions.RequestException as e:
+            OLLAMA_ROUTER.release(endpoint, error=str(e))
+            raise RuntimeError(f"Gagal terhubung ke Ollama API di {endpoint.generate_url}: {e}")
+        except ValueError as e:
+            OLLAMA_ROUTER.release(endpoint)
+            raise RuntimeError(f"Respons streaming Ollama tidak valid: {e}")
+        except RuntimeError:
+            OLLAMA_ROUTER.release(endpoint)
+            raise
+
+        llm_inference_time = round(time.time() - start_time, 3)
+        OLLAMA_ROUTER.release(endpoint, latency=llm_inference_time)
+        return result, llm_inference_time # type: ignore
 
 
 # === 🔹 Parsing JSON Aman ===
@@ -216,31 +594,626 @@ def safe_json_parse(text: str):
     except json.JSONDecodeError as e:
         raise ValueError(f"Gagal parsing JSON: {e}\nRaw JSON: {json_text[:500]}")
 
-# === 🔹 Load Model Embedding Sekali Saja ===
-print(f"\n🧠 Memuat model embedding MiniLM di {DEVICE_MODE}...")
-try:
-    start_load = time.time()
-    EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME, device=DEVICE_MODE)
-    EMBEDDING_MODEL.encode("warmup", convert_to_tensor=True)
-    load_time = round((time.time() - start_load), 2)
-    print(f"✅ Model MiniLM siap digunakan (load time {load_time} detik)\n")
-except Exception as e:
-    print(f"❌ Gagal memuat model MiniLM: {e}")
-    EMBEDDING_MODEL = None
+def parse_rubric(text: str) -> dict:
+    # Dengan structured output, respons sudah JSON murni; regex hanya jadi fallback
+    try:
+        parsed = json.loads(text.strip())
+    except ValueError:
+        parsed = safe_json_parse(text)
+
+    if not isinstance(parsed, dict):
+        raise ValueError("Respons JSON bukan objek.")
+    missing = [k for k in RUBRIC_KEYS if k not in parsed]
+    if missing:
+        raise ValueError(f"Kunci rubrik tidak lengkap: {missing}")
+    for key in RUBRIC_KEYS[:-1]:
+        try:
+            parsed[key] = max(0.0, min(100.0, float(parsed[key])))
+        except (TypeError, ValueError):
+            raise ValueError(f"Nilai rubrik '{key}' bukan angka: {parsed[key]!r}")
+    parsed["feedback"] = str(parsed["feedback"] or "")
+    return parsed
+
+
+def build_repair_prompt(raw_output: str, error: str) -> str:
+    return f"""
+Keluaran berikut seharusnya berupa JSON rubrik penilaian, tetapi tidak valid ({error}):
+
+{raw_output[:2000]}
+
+Perbaiki menjadi satu objek JSON valid dengan kunci "pemahaman", "kelengkapan", "kejelasan", "analisis" (angka 0–100) dan "feedback" (string).
+Jangan mengubah nilai atau isi feedback yang sudah ada. Keluarkan hanya JSON.
+"""
+
+# === 🔹 Load Model Embedding (Lazy) ===
+class StartupStats:
+    """Waktu import modul, load model embedding, dan latency request /grade pertama."""
+
+    def __init__(self):
+        self.import_time = None
+        self.embedding_load_time = None
+        self.embedding_error = None
+        self.device = None
+        self.embedding_backend = None
+        self.embedding_parity = None
+        self.first_request_latency = None
+        self.first_request_path = None
+
+    def record_first_request(self, path: str, latency: float) -> None:
+        if self.first_request_latency is None:
+            self.first_request_latency = round(latency, 3)
+            self.first_request_path = path
+
+    def stats(self) -> dict:
+        return {
+            "import_time": self.import_time,
+            "embedding_load_time": self.embedding_load_time,
+            "embedding_error": self.embedding_error,
+            "device": self.device,
+            "embedding_backend": self.embedding_backend,
+            "embedding_parity": self.embedding_parity,
+            "first_request_latency": self.first_request_latency,
+            "first_request_path": self.first_request_path,
+        }
+
+
+STARTUP_STATS = StartupStats()
+EMBEDDING_MODEL = None
+_embedding_lock = threading.Lock()
+
+PARITY_SENTENCES = [
+    "Virtual memory memungkinkan program berjalan melebihi kapasitas RAM fisik.",
+    "Paging membagi memori menjadi blok berukuran tetap yang disebut frame.",
+    "Sistem operasi mengatur jaringan internet dan koneksi WiFi.",
+    "def fibonacci(n): return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)",
+]
+
+
+def load_sentence_transformer(backend: str, device: str):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    if backend not in EMBEDDING_ONNX_FILES:
+        raise ValueError(f"EMBEDDING_BACKEND tidak dikenal: {backend} (pilih torch, onnx, atau onnx-int8)")
+    # ONNX Runtime dijalankan di CPU; file .onnx diambil dari repo model di Hugging Face
+    return SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": EMBEDDING_ONNX_FILES[backend]},
+    )
+
+
+def check_embedding_parity(model, device: str) -> dict:
+    """Cosine similarity embedding backend aktif vs PyTorch untuk kalimat contoh."""
+    reference = load_sentence_transformer("torch", device)
+    expected = reference.encode(PARITY_SENTENCES, convert_to_tensor=True, normalize_embeddings=True)
+    actual = model.encode(PARITY_SENTENCES, convert_to_tensor=True, normalize_embeddings=True).to(expected.device)
+    cosines = (expected * actual).sum(dim=1).tolist()
+    del reference
+    return {
+        "min_cosine": round(min(cosines), 6),
+        "mean_cosine": round(sum(cosines) / len(cosines), 6),
+        "threshold": EMBEDDING_PARITY_THRESHOLD,
+        "passed": min(cosines) >= EMBEDDING_PARITY_THRESHOLD,
+    }
+
+
+def get_embedding_model():
+    global EMBEDDING_MODEL
+    if EMBEDDING_MODEL is not None:
+        return EMBEDDING_MODEL
+    with _embedding_lock:
+        # Cek ulang di dalam lock: request lain mungkin sudah selesai memuat model
+        if EMBEDDING_MODEL is not None:
+            return EMBEDDING_MODEL
+        import torch
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"\n🧠 Memuat model embedding MiniLM ({EMBEDDING_BACKEND}) di {device}...")
+        try:
+            start_load = time.time()
+            model = load_sentence_transformer(EMBEDDING_BACKEND, device)
+            model.encode("warmup", convert_to_tensor=True)
+        except Exception as e:
+            STARTUP_STATS.embedding_error = str(e)
+            print(f"❌ Gagal memuat model MiniLM: {e}")
+            raise RuntimeError(f"Model embedding belum siap: {e}")
+        STARTUP_STATS.embedding_load_time = round(time.time() - start_load, 2)
+        STARTUP_STATS.embedding_error = None
+        STARTUP_STATS.device = device
+        STARTUP_STATS.embedding_backend = EMBEDDING_BACKEND
+
+        if EMBEDDING_PARITY_CHECK and EMBEDDING_BACKEND != "torch":
+            try:
+                parity = check_embedding_parity(model, device)
+                STARTUP_STATS.embedding_parity = parity
+                icon = "✅" if parity["passed"] else "⚠️"
+                print(f"{icon} Parity {EMBEDDING_BACKEND} vs torch: min cosine {parity['min_cosine']}")
+            except Exception as e:
+                print(f"⚠️ Gagal menjalankan parity check embedding: {e}")
+
+        EMBEDDING_MODEL = model
+        print(f"✅ Model MiniLM siap digunakan (load time {STARTUP_STATS.embedding_load_time} detik)\n")
+        return EMBEDDING_MODEL
+
+
+# === 🔹 Worker Proses Embedding ===
+_WORKER_MODEL = None
+
+
+def _init_embedding_worker(torch_threads: int) -> None:
+    # Dijalankan sekali di setiap proses worker: model dimuat per proses dengan jumlah thread tetap
+    global _WORKER_MODEL
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    _WORKER_MODEL = load_sentence_transformer(EMBEDDING_BACKEND, "cpu")
+    _WORKER_MODEL.encode("warmup", convert_to_tensor=True)
+
+
+def _worker_encode(texts: List[str]):
+    return _WORKER_MODEL.encode(texts, convert_to_numpy=True, normalize_embeddings=True) # type: ignore
+
+
+class EmbeddingWorkerPool:
+    """Pool proses embedding; request dikirim lewat antrian IPC ProcessPoolExecutor."""
+
+    def __init__(self, workers: int, torch_threads: int):
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self.ready = False
+        self.submitted = 0
+        self.failed = 0
+        self.restarts = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+            print(f"🧠 Menjalankan {self.workers} worker embedding ({self.torch_threads} thread torch per worker)...")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_embedding_worker,
+                initargs=(self.torch_threads,),
+            )
+            executor = self._executor
+        # Satu encode per worker supaya semua proses sudah memuat model sebelum ready
+        try:
+            warmups = [executor.submit(_worker_encode, ["warmup"]) for _ in range(self.workers)]
+            for warmup in warmups:
+                warmup.result()
+        except Exception:
+            # Warmup gagal (misal worker crash saat memuat model): pool dibuat ulang pada submit berikutnya
+            self._discard(executor)
+            raise
+        self.ready = True
+
+    def _discard(self, executor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.ready = False
+            self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, texts: List[str]) -> Future:
+        """Tidak pernah raise: kegagalan (termasuk pool rusak) dikirim lewat Future."""
+        import torch
+
+        result: Future = Future()
+        self.submitted += 1
+        executor = None
+        try:
+            if self._executor is None:
+                self.start()
+            executor = self._executor
+            worker_future = executor.submit(_worker_encode, texts) # type: ignore
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and executor is not None:
+                self._discard(executor)
+            self.failed += 1
+            result.set_exception(e)
+            return result
+
+        def done(worker_future):
+            try:
+                result.set_result(torch.from_numpy(worker_future.result()))
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    # Worker mati di tengah encode; request berikutnya memakai pool baru
+                    print(f"⚠️ Pool worker embedding rusak, dibuat ulang: {e}")
+                    self._discard(executor)
+                self.failed += 1
+                result.set_exception(e)
+
+        worker_future.add_done_callback(done)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self.ready = False
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "cpu_count": CPU_COUNT,
+            "ready": self.ready,
+            "submitted": self.submitted,
+            "failed": self.failed,
+            "restarts": self.restarts,
+        }
+
+
+EMBEDDING_POOL = EmbeddingWorkerPool(EMBEDDING_WORKERS, EMBEDDING_TORCH_THREADS)
+
+
+def run_embedding_batch(texts: List[str]) -> Future:
+    if EMBEDDING_POOL.enabled:
+        return EMBEDDING_POOL.submit(texts)
+    future: Future = Future()
+    try:
+        future.set_result(get_embedding_model().encode(texts, convert_to_tensor=True, normalize_embeddings=True))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def embedding_ready() -> bool:
+    return EMBEDDING_POOL.ready if EMBEDDING_POOL.enabled else EMBEDDING_MODEL is not None
+
+
+# === 🔹 Micro-Batching Encode ===
+class EmbeddingMicroBatcher:
+    """
+    Menggabungkan encode dari request /grade yang berjalan bersamaan menjadi satu batch.
+    Setiap pemanggil tetap menerima embedding untuk teksnya sendiri.
+    """
+
+    def __init__(self, wait_ms: float, max_size: int, max_in_flight: int):
+        self.wait = wait_ms / 1000
+        self.max_size = max_size
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_batch_size = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Batch berikutnya baru dikumpulkan saat ada worker bebas, sehingga batch membesar ketika sibuk
+        self._slots = threading.Semaphore(max_in_flight)
+
+    def encode(self, texts: List[str]):
+        if self.wait <= 0:
+            return run_embedding_batch(texts).result(timeout=EMBEDDING_TIMEOUT)
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((texts, future, time.time()))
+        return future.result(timeout=EMBEDDING_TIMEOUT)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="embedding-microbatch", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[tuple]:
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.time() + self.wait
+        while size < self.max_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(request)
+            size += len(request[0])
+        return pending
+
+    def _loop(self) -> None:
+        while True:
+            self._slots.acquire()
+            pending = self._collect()
+            started = time.time()
+            texts = [text for request_texts, _, _ in pending for text in request_texts]
+            try:
+                batch = run_embedding_batch(texts)
+            except Exception as e:
+                # Thread batcher harus tetap hidup: gagalkan request di batch ini saja
+                failed: Future = Future()
+                failed.set_exception(e)
+                self._deliver(pending, failed)
+                continue
+            batch.add_done_callback(lambda batch, pending=pending: self._deliver(pending, batch))
+
+            waits = [started - queued_at for _, _, queued_at in pending]
+            with self._lock:
+                self.batches += 1
+                self.texts += len(texts)
+                self.max_batch_size = max(self.max_batch_size, len(texts))
+                self.total_wait += sum(waits)
+                self.max_wait = max(self.max_wait, *waits)
+                self.requests += len(pending)
+
+    def _deliver(self, pending: List[tuple], batch: Future) -> None:
+        self._slots.release()
+        try:
+            embeddings = batch.result()
+        except Exception as e:
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future, _ in pending:
+            future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.wait > 0,
+                "wait_ms": self.wait * 1000,
+                "max_size": self.max_size,
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "avg_queue_wait_ms": round(self.total_wait / self.requests * 1000, 3) if self.requests else 0.0,
+                "max_queue_wait_ms": round(self.max_wait * 1000, 3),
+                "queue_depth": self._queue.qsize(),
+            }
+
+
+EMBEDDING_BATCHER = EmbeddingMicroBatcher(MICROBATCH_WAIT_MS, MICROBATCH_MAX_SIZE, max(1, EMBEDDING_WORKERS))
+
+
+def encode_texts(texts: List[str]):
+    return EMBEDDING_BATCHER.encode(texts)
+
+
+# === 🔹 Cache Embedding Kunci Jawaban ===
+class EmbeddingCache:
+    """LRU cache embedding ternormalisasi, key = hash isi teks + nama model + backend."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\x00{EMBEDDING_BACKEND}\x00{text.strip()}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str):
+        key = self.make_key(text)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or (self.ttl > 0 and time.time() - entry[1] > self.ttl):
+                if entry is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text: str, embedding) -> None:
+        if self.max_size <= 0:
+            return
+        key = self.make_key(text)
+        with self._lock:
+            self._items[key] = (embedding, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+ANSWER_KEY_CACHE = EmbeddingCache(ANSWER_KEY_CACHE_SIZE, ANSWER_KEY_CACHE_TTL)
 
 
 # === 🔹 Hitung Similarity dengan MiniLM ===
-def compute_embedding_similarity(student_answer: str, answer_key: str):
-    if EMBEDDING_MODEL is None:
-        raise RuntimeError("Model embedding belum siap.")
+def precomputed_key_embedding(vector: Optional[List[float]], embedding_model: Optional[str]):
+    if not vector or embedding_model != EMBEDDING_MODEL_ID:
+        return None
+    import torch
+    return torch.tensor(vector, dtype=torch.float32)
+
+
+def compute_embedding_similarity(student_answer: str, answer_key: str, key_embedding=None):
     start_time = time.time()
-    emb_key = EMBEDDING_MODEL.encode(answer_key, convert_to_tensor=True, normalize_embeddings=True)
-    emb_ans = EMBEDDING_MODEL.encode(student_answer, convert_to_tensor=True, normalize_embeddings=True)
-    similarity = util.cos_sim(emb_key, emb_ans).item()
+    emb_key = key_embedding if key_embedding is not None else ANSWER_KEY_CACHE.get(answer_key)
+    if emb_key is None:
+        # Kunci jawaban dan jawaban mahasiswa di-encode dalam satu panggilan
+        emb_key, emb_ans = encode_texts([answer_key, student_answer])
+        ANSWER_KEY_CACHE.put(answer_key, emb_key)
+    else:
+        emb_ans = encode_texts([student_answer])[0]
+    # Embedding sudah ternormalisasi, jadi dot product = cosine similarity
+    similarity = (emb_key.to(emb_ans.device) * emb_ans).sum().item()
     duration = round((time.time() - start_time), 3)
     return round(similarity * 100, 2), duration
 
 
+def compute_embedding_similarities(pairs: List[tuple], precomputed: Optional[list] = None):
+    """
+    Hitung similarity banyak pasangan (student_answer, answer_key) dengan satu kali encode.
+    precomputed (opsional) berisi embedding kunci jawaban dari backend per pasangan, atau None.
+    """
+    if not pairs:
+        return [], 0.0
+    import torch
+    start_time = time.time()
+    precomputed = precomputed or [None] * len(pairs)
+
+    # Kunci jawaban yang belum ada di cache ikut di-encode bersama jawaban mahasiswa
+    key_embeddings = {}
+    missing_keys = []
+    for (_, answer_key), given in zip(pairs, precomputed):
+        if given is not None or answer_key in key_embeddings or answer_key in missing_keys:
+            continue
+        cached = ANSWER_KEY_CACHE.get(answer_key)
+        if cached is None:
+            missing_keys.append(answer_key)
+        else:
+            key_embeddings[answer_key] = cached
+
+    texts = missing_keys + [student_answer for student_answer, _ in pairs]
+    embeddings = encode_texts(texts)
+    for answer_key, embedding in zip(missing_keys, embeddings[:len(missing_keys)]):
+        ANSWER_KEY_CACHE.put(answer_key, embedding)
+        key_embeddings[answer_key] = embedding
+
+    emb_answers = embeddings[len(missing_keys):]
+    emb_keys = torch.stack([
+        (given if given is not None else key_embeddings[answer_key]).to(emb_answers.device)
+        for (_, answer_key), given in zip(pairs, precomputed)
+    ])
+    similarities = (emb_keys * emb_answers).sum(dim=1).tolist()
+    duration = round((time.time() - start_time), 3)
+    return [round(sim * 100, 2) for sim in similarities], duration
+
+
+# === 🔹 Cache Hasil Penilaian ===
+class GradeResultCache:
+    """
+    Cache hasil /grade di SQLite. Ollama dipanggil dengan temperature 0.0 sehingga
+    input yang sama (termasuk versi prompt dan model) selalu memberi hasil yang sama.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS grade_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question: str, answer_key: str, student_answer: str, model: str, prompt_type: str = "") -> str:
+        raw = json.dumps(
+            [PROMPT_VERSION, OLLAMA_FORMAT, EMBEDDING_BACKEND, model, prompt_type, question.strip(), answer_key.strip(), (student_answer or "").strip()],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, answer_key: str, student_answer: str, model: str, prompt_type: str = "") -> Optional[dict]:
+        key = self.make_key(question, answer_key, student_answer, model, prompt_type)
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM grade_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, question: str, answer_key: str, student_answer: str, model: str, result: dict, prompt_type: str = "") -> None:
+        key = self.make_key(question, answer_key, student_answer, model, prompt_type)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grade_cache (key, model, prompt_version, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, PROMPT_VERSION, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def invalidate(self, model: Optional[str] = None, prompt_version: Optional[str] = None) -> int:
+        query, params = "DELETE FROM grade_cache WHERE 1=1", []
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+        if prompt_version:
+            query += " AND prompt_version = ?"
+            params.append(prompt_version)
+        with self._lock:
+            deleted = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM grade_cache").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "path": self.path,
+                "prompt_version": PROMPT_VERSION,
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+GRADE_CACHE = GradeResultCache(GRADE_CACHE_PATH) if GRADE_CACHE_ENABLED else None
+
+
+def get_cached_grade(question: str, answer_key: str, student_answer: str, model: str, prompt_type: str = "") -> Optional[dict]:
+    if GRADE_CACHE is None:
+        return None
+    cached = GRADE_CACHE.get(question, answer_key, student_answer, model, prompt_type)
+    if cached is None:
+        return None
+    print("♻️ Hasil penilaian diambil dari cache (tanpa panggilan LLM).")
+    # Waktu yang dilaporkan adalah waktu nyata request ini, bukan waktu saat hasil disimpan
+    return {**cached, "llm_time": 0.0, "similarity_time": 0.0, "cached": True}
+
+
+def store_cached_grade(question: str, answer_key: str, student_answer: str, model: str, result: dict, prompt_type: str = "") -> None:
+    if GRADE_CACHE is not None:
+        GRADE_CACHE.put(question, answer_key, student_answer, model, result, prompt_type)
+
+
 # === 🔹 Gabungkan Skor ===
 def fuse_scores(llm_scores: dict, sim_score: float, weight_llm: float = 0.85):
     weights = {"pemahaman": 0.35, "kelengkapan": 0.35, "kejelasan": 0.1, "analisis": 0.2}
@@ -249,36 +1222,44 @@ def fuse_scores(llm_scores: dict, sim_score: float, weight_llm: float = 0.85):
     return max(0, min(100, final)), llm_avg
 
 
-# === 🔹 Endpoint /grade ===
-@app.post("/grade")
-def grade(req: GradeRequest):
-    prompt = build_prompt(req.question, req.answer_key, req.student_answer)
-
-    # 🔸 1. Panggil Ollama
-    try:
-        model_resp, llm_time = call_ollama(prompt, model=DEFAULT_MODEL)
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    model_text = (
-        model_resp.get("response")
-        or model_resp.get("output")
-        or model_resp.get("raw")
-        or json.dumps(model_resp)
-    )
-
-    # 🔸 2. Parse JSON
-    try:
-        parsed = safe_json_parse(model_text)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail={"message": "Model tidak mengembalikan JSON valid.", "raw": model_text})
-
-    # 🔸 3. Hitung Similarity
-    try:
-        sim_value, sim_time = compute_embedding_similarity(req.student_answer, req.answer_key)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Gagal menghitung similarity embedding: {e}")
-
+# === 🔹 Panggil LLM & Parse Rubrik ===
+def grade_with_llm(question: str, answer_key: str, student_answer: str, model: str = DEFAULT_MODEL, prompt_type: Optional[str] = None):
+    prompt = build_prompt(question, answer_key, student_answer, prompt_type)
+    output_format = get_output_format()
+    llm_time = 0.0
+
+    for attempt in range(OLLAMA_REPAIR_RETRIES + 1):
+        # 🔸 1. Panggil Ollama
+        try:
+            model_resp, call_time = call_ollama(prompt, model=model, output_format=output_format)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        llm_time = round(llm_time + call_time, 3)
+
+        if model_resp.get("ttft") is not None:
+            print(f"⚡ TTFT: {model_resp['ttft']} detik, {model_resp['tokens_per_sec']} token/detik, early stop: {model_resp['early_stop']}")
+
+        model_text = (
+            model_resp.get("response")
+            or model_resp.get("output")
+            or model_resp.get("raw")
+            or json.dumps(model_resp)
+        )
+
+        # 🔸 2. Parse JSON
+        try:
+            parsed = parse_rubric(model_text)
+            return parsed, model_text, llm_time
+        except ValueError as e:
+            if attempt < OLLAMA_REPAIR_RETRIES:
+                print(f"🔧 Output model tidak valid ({e}), mencoba perbaikan {attempt + 1}/{OLLAMA_REPAIR_RETRIES}...")
+                prompt = build_repair_prompt(model_text, str(e))
+
+    raise HTTPException(status_code=502, detail={"message": "Model tidak mengembalikan JSON valid.", "raw": model_text})
+
+
+# === 🔹 Susun Hasil Akhir ===
+def build_grade_result(question: str, answer_key: str, student_answer: str, parsed: dict, model_text: str, llm_time: float, sim_value: float, sim_time: float):
     # 🔸 4. Hitung Skor Gabungan
     try:
         final_score, llm_score_avg = fuse_scores(parsed, sim_value)
@@ -292,9 +1273,9 @@ def grade(req: GradeRequest):
 
     print("\n" + "="*60)
     print("🧠 BENCHMARK INFERENCE RESULT")
-    print("📝 Question     :", wrapper.fill(req.question if req.question else "(kosong)"))
-    print("🔑 Answer Key   :", wrapper.fill(req.answer_key if req.answer_key else "(kosong)"))
-    print("🎓 Student Answer:", wrapper.fill(req.student_answer if req.student_answer else "(kosong)"))
+    print("📝 Question     :", wrapper.fill(question if question else "(kosong)"))
+    print("🔑 Answer Key   :", wrapper.fill(answer_key if answer_key else "(kosong)"))
+    print("🎓 Student Answer:", wrapper.fill(student_answer if student_answer else "(kosong)"))
     print("="*60)
     print("📝 LLM Raw Response:")
     print(model_text)
@@ -323,8 +1304,121 @@ def grade(req: GradeRequest):
     }
 
 
+# === 🔹 Endpoint /grade ===
+@app.post("/grade")
+def grade(req: GradeRequest):
+    prompt_type = resolve_prompt_type(req.prompt_type, req.answer_key)
+    cached = get_cached_grade(req.question, req.answer_key, req.student_answer, DEFAULT_MODEL, prompt_type)
+    if cached is not None:
+        return cached
+
+    parsed, model_text, llm_time = grade_with_llm(req.question, req.answer_key, req.student_answer, model=DEFAULT_MODEL, prompt_type=prompt_type)
+
+    # 🔸 3. Hitung Similarity
+    try:
+        key_embedding = precomputed_key_embedding(req.answer_key_embedding, req.embedding_model)
+        sim_value, sim_time = compute_embedding_similarity(req.student_answer, req.answer_key, key_embedding)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal menghitung similarity embedding: {e}")
+
+    result = build_grade_result(req.question, req.answer_key, req.student_answer, parsed, model_text, llm_time, sim_value, sim_time)
+    store_cached_grade(req.question, req.answer_key, req.student_answer, DEFAULT_MODEL, result, prompt_type)
+    return result
+
+
+# === 🔹 Endpoint /grade/batch ===
+@app.post("/grade/batch")
+def grade_batch(req: GradeBatchRequest):
+    prompt_types = [resolve_prompt_type(item.prompt_type, item.answer_key) for item in req.items]
+    results: List[Optional[dict]] = [
+        get_cached_grade(item.question, item.answer_key, item.student_answer, DEFAULT_MODEL, prompt_type)
+        for item, prompt_type in zip(req.items, prompt_types)
+    ]
+    pending = [idx for idx, cached in enumerate(results) if cached is None]
+
+    # 🔸 Similarity semua item yang belum di-cache dihitung dengan satu kali encode
+    try:
+        sim_values, batch_sim_time = compute_embedding_similarities(
+            [(req.items[idx].student_answer, req.items[idx].answer_key) for idx in pending],
+            [precomputed_key_embedding(req.items[idx].answer_key_embedding, req.items[idx].embedding_model) for idx in pending]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal menghitung similarity embedding: {e}")
+
+    sim_time = round(batch_sim_time / len(pending), 3) if pending else 0.0
+
+    def grade_item(idx: int, sim_value: float) -> dict:
+        item = req.items[idx]
+        try:
+            parsed, model_text, llm_time = grade_with_llm(item.question, item.answer_key, item.student_answer, model=DEFAULT_MODEL, prompt_type=prompt_types[idx])
+            result = build_grade_result(item.question, item.answer_key, item.student_answer, parsed, model_text, llm_time, sim_value, sim_time)
+            store_cached_grade(item.question, item.answer_key, item.student_answer, DEFAULT_MODEL, result, prompt_types[idx])
+            return result
+        except HTTPException as e:
+            # Item yang gagal tidak menggagalkan seluruh batch
+            return {"error": e.detail, "status_code": e.status_code}
+
+    # 🔸 Panggilan LLM berjalan bersamaan dan disebar OLLAMA_ROUTER ke semua endpoint
+    for idx, result in zip(pending, LLM_EXECUTOR.map(grade_item, pending, sim_values)):
+        results[idx] = result
+
+    return {"results": results, "similarity_time": batch_sim_time}
+
+
+# === 🔹 Endpoint /embed ===
+@app.post("/embed")
+def embed(req: EmbedRequest):
+    """Embedding kunci jawaban untuk disimpan backend per soal, beserta tipe prompt dan versinya."""
+    start_time = time.time()
+    try:
+        embeddings = encode_texts(req.texts) if req.texts else []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal menghitung embedding: {e}")
+
+    for text, embedding in zip(req.texts, embeddings):
+        ANSWER_KEY_CACHE.put(text, embedding)
+
+    return {
+        "embedding_model": EMBEDDING_MODEL_ID,
+        "prompt_version": PROMPT_VERSION,
+        "embeddings": [embedding.cpu().tolist() for embedding in embeddings],
+        "prompt_types": [detect_prompt_type(text) for text in req.texts],
+        "time": round(time.time() - start_time, 3),
+    }
+
+
+# === 🔹 Admin Cache Hasil Penilaian ===
+def require_admin(x_admin_token: Optional[str]):
+    # Grader bisa diakses lewat tunnel publik: tanpa GRADER_ADMIN_TOKEN endpoint admin dimatikan
+    if not GRADER_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint admin nonaktif, set GRADER_ADMIN_TOKEN untuk mengaktifkan.")
+    if x_admin_token != GRADER_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token admin tidak valid.")
+
+
+@app.get("/admin/cache")
+def admin_cache_stats(x_admin_token: Optional[str] = Header(default=None)):
+    require_admin(x_admin_token)
+    return {
+        "grade_cache": GRADE_CACHE.stats() if GRADE_CACHE is not None else None,
+        "answer_key_cache": ANSWER_KEY_CACHE.stats(),
+    }
+
+
+@app.delete("/admin/cache")
+def admin_invalidate_cache(
+    model: Optional[str] = None,
+    prompt_version: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    require_admin(x_admin_token)
+    deleted = GRADE_CACHE.invalidate(model=model, prompt_version=prompt_version) if GRADE_CACHE is not None else 0
+    if not model and not prompt_version:
+        ANSWER_KEY_CACHE.clear()
+    return {"deleted": deleted}
+
+
 # === 🔹 Warmup Model Ollama ===
-@app.on_event("startup")
 def warmup_models():
     print("\n🚀 Melakukan warm-up sistem Auto-Grader...")
 
@@ -350,13 +1444,51 @@ def warmup_models():
     try:
         print("🔹 Warm-up MiniLM embedding...")
         start = time.time()
-        _ = EMBEDDING_MODEL.encode("warm-up MiniLM", convert_to_tensor=True, normalize_embeddings=True) # type: ignore
+        if EMBEDDING_POOL.enabled:
+            EMBEDDING_POOL.start()
+        else:
+            _ = get_embedding_model().encode("warm-up MiniLM", convert_to_tensor=True, normalize_embeddings=True)
         print(f"✅ Embedding siap (waktu: {round(time.time() - start, 2)} detik)")
     except Exception as e:
         print(f"⚠️ Gagal warm-up embedding: {e}")
 
     print("🔥 Semua komponen siap digunakan!\n")
 
+# === 🔹 Health & Readiness ===
+@app.middleware("http")
+async def track_first_request(request: Request, call_next):
+    if STARTUP_STATS.first_request_latency is not None or not request.url.path.startswith("/grade"):
+        return await call_next(request)
+    start = time.time()
+    response = await call_next(request)
+    STARTUP_STATS.record_first_request(request.url.path, time.time() - start)
+    return response
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    body = {"ready": embedding_ready(), "startup": STARTUP_STATS.stats()}
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+
+# === 🔹 Endpoint /metrics ===
+@app.get("/metrics")
+def metrics():
+    return {
+        "startup": STARTUP_STATS.stats(),
+        "answer_key_cache": ANSWER_KEY_CACHE.stats(),
+        "grade_cache": GRADE_CACHE.stats() if GRADE_CACHE is not None else None,
+        "embedding_batcher": EMBEDDING_BATCHER.stats(),
+        "embedding_workers": EMBEDDING_POOL.stats(),
+        "llm": LLM_STATS.stats(),
+        "ollama_endpoints": OLLAMA_ROUTER.stats(),
+    }
+
 @app.get("/", response_class=HTMLResponse)
 def root():
     html_content = """
@@ -438,8 +1570,10 @@ def root():
 """
     return html_content
 
+STARTUP_STATS.import_time = round(time.time() - _IMPORT_STARTED_AT, 3)
+
 # === 🔹 Entry Point ===
 if __name__ == "__main__":
     import uvicorn
     print("Starting Ollama Hybrid Auto-Grader on http://localhost:5555")
-    uvicorn.run("ollama_auto_grader:app", host="0.0.0.0", port=5555, reload=False)
\ No newline at end of file
+    uvicorn.run("ollama_auto_grader:app", host="0.0.0.0", port=5555, reload=False)
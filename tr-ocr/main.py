@@ -2,8 +2,26 @@ import fitz
 import os
 import cv2
 import re
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from image_processing import correct_perspective, detect_answer_boxes
-from ocr_processing import segment_and_ocr
+from ocr_processing import OCR_DEBUG, extract_line_crops, ocr_lines, should_write_debug
+
+# Render halaman disimpan ke output_images/ hanya jika OCR_DEBUG aktif (lihat ocr_processing)
+DEBUG_FOLDER = "output_images" if OCR_DEBUG != "off" else None
+PAGE_DPI = 300
+
+# Mode paralel: 0 = semua halaman berurutan di satu proses; "auto" = satu worker per 2 core
+CPU_COUNT = os.cpu_count() or 1
+_ocr_workers_env = os.getenv("OCR_WORKERS", "0").lower()
+OCR_WORKERS = max(1, CPU_COUNT // 2) if _ocr_workers_env == "auto" else max(0, int(_ocr_workers_env))
+# "worker": setiap worker memuat TrOCR sendiri (cepat, memori model x jumlah worker)
+# "shared": worker hanya render + OpenCV, TrOCR berjalan sekali di proses utama
+OCR_INFERENCE = os.getenv("OCR_INFERENCE", "worker").lower()
+# Thread torch per worker; default membagi core secara merata agar worker tidak saling berebut
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", "0")) or max(1, CPU_COUNT // max(1, OCR_WORKERS))
 
 def pdf_to_images(pdf_path, output_folder="output_images"):
     if not os.path.exists(output_folder):
@@ -22,40 +40,185 @@ def pdf_to_images(pdf_path, output_folder="output_images"):
     return image_paths
 
 
-def main():
-    pdf_path = "files/test10.pdf"
+def pixmap_to_array(pix):
+    """
+    View NumPy atas buffer pixmap tanpa salinan (height, width, n).
+    Stride baris bisa lebih besar dari width * n, jadi padding di akhir baris dibuang lewat slicing.
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
 
-    print("[INFO] Mengubah PDF ke gambar...")
-    images = pdf_to_images(pdf_path)
 
-    all_text = []
+def render_page(doc, page_index, dpi=PAGE_DPI, debug_folder=None):
+    """Render satu halaman ke gambar BGR (layout sama dengan hasil cv2.imread)."""
+    pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    # Satu-satunya salinan: konversi ke BGR, setelah itu pixmap boleh dilepas
+    image = cv2.cvtColor(pixmap_to_array(pix), cv2.COLOR_RGB2BGR)
+    del pix
+
+    if debug_folder and should_write_debug(page_index + 1):
+        cv2.imwrite(os.path.join(debug_folder, f"page_{page_index+1}.png"), image)
+
+    return image
+
+
+def open_pdf(source):
+    """Buka PDF dari path atau langsung dari bytes (misalnya hasil upload ke ocr_server)."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
 
-    for img_path in images:
-        print(f"[INFO] Memproses {img_path}...")
 
-        # 1. Load gambar
-        image = cv2.imread(img_path)
+def iter_pdf_pages(pdf_path, dpi=PAGE_DPI, debug_folder=None):
+    """
+    Render halaman PDF (path atau bytes) satu per satu langsung di memori dan yield (nomor_halaman, gambar BGR).
+    Hanya satu halaman yang hidup di memori; file PNG ditulis hanya jika debug_folder diisi
+    dan halaman ini termasuk level OCR_DEBUG.
+    """
+    if debug_folder:
+        os.makedirs(debug_folder, exist_ok=True)
+
+    with open_pdf(pdf_path) as doc:
+        for page_index in range(len(doc)):
+            yield page_index + 1, render_page(doc, page_index, dpi, debug_folder)
+
+
+def extract_page_crops(page_number, image):
+    """
+    Koreksi perspektif, deteksi kotak jawaban, dan segmentasi baris.
+    Mengembalikan (crop baris per kotak, waktu per tahap dalam detik).
+    """
+    timings = {}
+    debug = should_write_debug(page_number)
+
+    # 1. Koreksi perspektif
+    start = time.perf_counter()
+    processed_img = correct_perspective(image)
+
+    # 2. Deteksi kotak jawaban
+    answer_boxes = detect_answer_boxes(processed_img, max_boxes=2, visualize=False)
+    timings["boxes"] = time.perf_counter() - start
+
+    # 3. Segmentasi baris tiap kotak jawaban
+    crops_per_box = [
+        extract_line_crops(crop, debug_dir=f"debug_{i}", debug=debug, timings=timings)
+        for i, crop in enumerate(answer_boxes)
+    ]
+    return crops_per_box, timings
+
+
+def format_timings(timings):
+    return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+
+
+def ocr_page_crops(page_number, crops_per_box, segment_time, timings=None):
+    """OCR semua baris satu halaman sekaligus dalam batch, lalu kembalikan teks per kotak jawaban."""
+    # 4. OCR semua baris sekaligus, lalu kembalikan ke kotaknya
+    start_ocr = time.time()
+    page_lines = ocr_lines([line for crops in crops_per_box for line in crops])
+    ocr_time = time.time() - start_ocr
+
+    box_texts = []
+    offset = 0
+    for crops in crops_per_box:
+        text = "\n".join(page_lines[offset:offset + len(crops)])
+        offset += len(crops)
+        text = re.sub(r'\n+', '\n', text).strip()  
+        text += "\n"
+        box_texts.append(text)
+
+    lines_per_second = len(page_lines) / ocr_time if ocr_time > 0 else 0.0
+    print(f"[INFO] Halaman {page_number}: {len(page_lines)} baris, segmentasi {segment_time:.2f}s, "
+          f"OCR {ocr_time:.2f}s ({lines_per_second:.2f} baris/detik), total {segment_time + ocr_time:.2f}s")
+    if timings:
+        print(f"[INFO] Halaman {page_number} per tahap: {format_timings(timings)}")
+    return box_texts
+
+
+def process_page(page_number, image):
+    start_page = time.time()
+    crops_per_box, timings = extract_page_crops(page_number, image)
+    return ocr_page_crops(page_number, crops_per_box, time.time() - start_page, timings)
+
+
+# ========================================================================
+#  MODE PARALEL (ProcessPoolExecutor, satu halaman per task)
+# ========================================================================
+_worker_doc = None
+_worker_debug_folder = None
+
+def _init_ocr_worker(pdf_path, torch_threads, debug_folder):
+    # Dijalankan sekali per worker: PDF dibuka sekali, halaman dirender sendiri berdasarkan indeks
+    global _worker_doc, _worker_debug_folder
+    import torch
+    torch.set_num_threads(torch_threads)
+    cv2.setNumThreads(1)
+    _worker_doc = fitz.open(pdf_path)
+    _worker_debug_folder = debug_folder
+
+
+def _worker_extract(page_number):
+    start_page = time.time()
+    image = render_page(_worker_doc, page_number - 1, debug_folder=_worker_debug_folder)
+    render_time = time.time() - start_page
+    crops_per_box, timings = extract_page_crops(page_number, image)
+    return crops_per_box, time.time() - start_page, {"render": render_time, **timings}
+
+
+def _worker_process(page_number):
+    return ocr_page_crops(page_number, *_worker_extract(page_number))
+
+
+def ocr_pdf_parallel(pdf_path, workers=OCR_WORKERS, inference=OCR_INFERENCE, debug_folder=DEBUG_FOLDER):
+    """
+    OCR semua halaman PDF tersebar ke beberapa proses. Hasil (teks per kotak jawaban)
+    tetap berurutan sesuai halaman karena executor.map mengembalikan hasil sesuai urutan input.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_numbers = list(range(1, len(doc) + 1))
+    if debug_folder:
+        os.makedirs(debug_folder, exist_ok=True)
 
-        # 2. Koreksi perspektif
-        processed_img = correct_perspective(image)
+    all_text = []
+    ctx = multiprocessing.get_context("spawn")
+    torch_threads = OCR_TORCH_THREADS if inference == "worker" else 1
+    with ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=ctx,
+        initializer=_init_ocr_worker,
+        initargs=(pdf_path, torch_threads, debug_folder)
+    ) as executor:
+        if inference == "shared":
+            # Worker menyiapkan halaman berikutnya selagi proses ini menjalankan TrOCR dengan semua thread
+            for page_number, extracted in zip(page_numbers, executor.map(_worker_extract, page_numbers)):
+                all_text.extend(ocr_page_crops(page_number, *extracted))
+        else:
+            for box_texts in executor.map(_worker_process, page_numbers):
+                all_text.extend(box_texts)
+    return all_text
 
-        # 3. Deteksi kotak jawaban
-        answer_boxes = detect_answer_boxes(processed_img, max_boxes=2, visualize=False)
 
-        # 4. OCR tiap kotak jawaban
-        for i, crop in enumerate(answer_boxes):
-            text = segment_and_ocr(crop, debug_dir=f"debug_{i}")
-            text = re.sub(r'\n+', '\n', text).strip()  
-            text += "\n"
-            all_text.append(text)
+def main():
+    pdf_path = "files/test10.pdf"
+    start_time = time.time()
+
+    if OCR_WORKERS > 0:
+        print(f"[INFO] OCR paralel: {OCR_WORKERS} worker, inference {OCR_INFERENCE}, {OCR_TORCH_THREADS} thread torch per worker")
+        all_text = ocr_pdf_parallel(pdf_path)
+    else:
+        print("[INFO] Merender PDF halaman per halaman...")
+        all_text = []
+        for page_number, image in iter_pdf_pages(pdf_path, debug_folder=DEBUG_FOLDER):
+            print(f"[INFO] Memproses halaman {page_number}...")
+            all_text.extend(process_page(page_number, image))
  
     final_text = "\n".join(all_text)
 
-    # 5. Simpan hasil ke file
+    # Simpan hasil ke file
     with open("hasil_ocr.txt", "w", encoding="utf-8") as f:
         f.write(final_text)
 
-    print("[INFO] OCR selesai. Hasil tersimpan di hasil_ocr.txt")
+    print(f"[INFO] OCR selesai dalam {time.time() - start_time:.2f}s. Hasil tersimpan di hasil_ocr.txt")
 
 
 if __name__ == "__main__":
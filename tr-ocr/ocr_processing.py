@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
 import os
+import time
+import itertools
+import torch
 from PIL import Image
 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 import matplotlib.pyplot as plt
@@ -11,15 +14,63 @@ import matplotlib.pyplot as plt
 # (Fungsi ocr_single_line, deskew_image_hough, remove_horizontal_lines_morphological)
 
 # ... (kode BAGIAN 1, 2, 3 Anda di sini) ...
-processor = TrOCRProcessor.from_pretrained("microsoft/trocr-large-handwritten")
-model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-large-handwritten")
+OCR_MODEL_NAME = "microsoft/trocr-large-handwritten"
+processor = None
+model = None
+
+def load_ocr_model():
+    """
+    Muat TrOCR saat pertama kali dipakai (bukan saat import), sehingga proses yang hanya
+    melakukan preprocessing OpenCV tidak ikut memuat model berukuran GB.
+    """
+    global processor, model
+    if model is None:
+        processor = TrOCRProcessor.from_pretrained(OCR_MODEL_NAME)
+        model = VisionEncoderDecoderModel.from_pretrained(OCR_MODEL_NAME)
+        model.eval()
+    return processor, model
+
+# Jumlah potongan baris yang di-decode sekaligus dalam satu model.generate
+OCR_BATCH_SIZE = max(1, int(os.getenv("OCR_BATCH_SIZE", "8")))
+
+# Artefak debug (PNG per tahap dan per crop): "off" (produksi), "all", atau "sampled" (1 dari N halaman)
+OCR_DEBUG = os.getenv("OCR_DEBUG", "off").lower()
+OCR_DEBUG_SAMPLE_RATE = max(1, int(os.getenv("OCR_DEBUG_SAMPLE_RATE", "10")))
+_debug_counter = itertools.count()
+
+def should_write_debug(page_number=None):
+    """Apakah artefak debug ditulis untuk halaman ini (tanpa nomor halaman, dihitung per panggilan)."""
+    if OCR_DEBUG == "all":
+        return True
+    if OCR_DEBUG == "sampled":
+        index = page_number - 1 if page_number is not None else next(_debug_counter)
+        return index % OCR_DEBUG_SAMPLE_RATE == 0
+    return False
+
+def _add_time(timings, stage, start):
+    now = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + (now - start)
+    return now
+
+def ocr_lines(images_pil, batch_size=OCR_BATCH_SIZE):
+    """
+    OCR banyak potongan baris sekaligus. Processor TrOCR me-resize setiap crop ke ukuran
+    yang sama, sehingga crop dengan lebar berbeda tetap bisa digabung dalam satu batch.
+    """
+    if not images_pil:
+        return []
+    processor, model = load_ocr_model()
+    texts = []
+    for start in range(0, len(images_pil), batch_size):
+        batch = [img if img.mode == 'RGB' else img.convert('RGB') for img in images_pil[start:start + batch_size]]
+        pixel_values = processor(images=batch, return_tensors="pt").pixel_values
+        with torch.inference_mode():
+            generated_ids = model.generate(pixel_values)
+        texts.extend(processor.batch_decode(generated_ids, skip_special_tokens=True))
+    return texts
 
 def ocr_single_line(image_pil):
-    if image_pil.mode != 'RGB':
-        image_pil = image_pil.convert('RGB')
-    pixel_values = processor(images=image_pil, return_tensors="pt").pixel_values
-    generated_ids = model.generate(pixel_values)
-    return processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    return ocr_lines([image_pil])[0]
 
 def deskew_image_hough(color_image):
     gray = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
@@ -65,7 +116,7 @@ def segment_lines_with_contours(binary_image, min_w=5, min_h=5):
     mengembalikannya.
     """
     # 1. Temukan dan filter kontur awal
-    contours, _ = cv2.findContours(binary_image.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     initial_boxes = sorted(
         [cv2.boundingRect(c) for c in contours if cv2.boundingRect(c)[2] > min_w and cv2.boundingRect(c)[3] > min_h],
         key=lambda b: b[1]
@@ -122,38 +173,51 @@ def segment_lines_with_contours(binary_image, min_w=5, min_h=5):
     
     return final_line_rois
 
-def segment_and_ocr(image_input, debug_dir="debug_results"):
+def extract_line_crops(color_image, debug_dir="debug_results", debug=None, timings=None):
     """
-    Membaca gambar, meluruskan, membersihkan, melakukan segmentasi
-    berbasis kontur, dan menjalankan OCR.
-    """
-    if isinstance(image_input, str):
-        color_image = cv2.imread(image_input)
-        if color_image is None: return "⚠️ Gambar tidak ditemukan."
-    else:
-        color_image = image_input.copy()
+    Meluruskan, membersihkan, dan melakukan segmentasi berbasis kontur.
+    Mengembalikan potongan baris (PIL, teks hitam di background putih) yang siap di-OCR.
 
-    if not os.path.exists(debug_dir): os.makedirs(debug_dir)
+    debug=None mengikuti OCR_DEBUG. Tanpa debug tidak ada encode PNG maupun salinan gambar.
+    timings (dict) diisi akumulasi detik per tahap: deskew, remove_lines, segment, crop, debug_write.
+    """
+    if debug is None:
+        debug = should_write_debug()
+    if timings is None:
+        timings = {}
+    if debug:
+        os.makedirs(debug_dir, exist_ok=True)
 
     # === Langkah 1 & 2: Deskew dan Hapus Garis (Sama seperti sebelumnya) ===
+    start = time.perf_counter()
     deskewed_color_image = deskew_image_hough(color_image)
-    cv2.imwrite(os.path.join(debug_dir, "debug_deskewed.png"), deskewed_color_image)
+    start = _add_time(timings, "deskew", start)
+    if debug:
+        cv2.imwrite(os.path.join(debug_dir, "debug_deskewed.png"), deskewed_color_image)
+        start = _add_time(timings, "debug_write", start)
 
     image_no_lines = remove_horizontal_lines_morphological(deskewed_color_image)
-    cv2.imwrite(os.path.join(debug_dir, "debug_cleaned_binary.png"), image_no_lines)
+    start = _add_time(timings, "remove_lines", start)
+    if debug:
+        cv2.imwrite(os.path.join(debug_dir, "debug_cleaned_binary.png"), image_no_lines)
+        start = _add_time(timings, "debug_write", start)
 
     # === Langkah 3: Segmentasi dengan Kontur (Metode Baru) ===
     line_bounding_boxes = segment_lines_with_contours(image_no_lines)
+    start = _add_time(timings, "segment", start)
 
-    # Gambar kotak-kotak baris yang terdeteksi untuk debugging
-    debug_img_contours = deskewed_color_image.copy()
-    for x, y, w, h in line_bounding_boxes:
-        cv2.rectangle(debug_img_contours, (x, y), (x + w, y + h), (0, 255, 0), 2)
-    cv2.imwrite(os.path.join(debug_dir, "debug_line_detection.png"), debug_img_contours)
+    if debug:
+        # Gambar kotak-kotak baris yang terdeteksi untuk debugging
+        debug_img_contours = deskewed_color_image.copy()
+        for x, y, w, h in line_bounding_boxes:
+            cv2.rectangle(debug_img_contours, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.imwrite(os.path.join(debug_dir, "debug_line_detection.png"), debug_img_contours)
+        start = _add_time(timings, "debug_write", start)
 
 
-    # === Langkah 4: OCR per baris yang tersegmentasi ===
-    final_text = []
+    # === Langkah 4: Potong setiap baris yang tersegmentasi ===
+    line_crops = []
+    debug_crops = []
     padding = 5 # Beri sedikit ruang di sekitar teks saat memotong
     for i, (x, y, w, h) in enumerate(line_bounding_boxes):
         # Crop dari gambar biner yang sudah bersih
@@ -165,14 +229,34 @@ def segment_and_ocr(image_input, debug_dir="debug_results"):
         # Invert warna (teks menjadi hitam, background putih) untuk model TrOCR
         roi_final = cv2.bitwise_not(roi_cleaned_binary)
         
-        # Konversi ke format yang bisa dibaca TrOCR dan jalankan OCR
-        roi_pil = Image.fromarray(roi_final)
-        text = ocr_single_line(roi_pil)
-        final_text.append(text)
+        # Konversi ke format yang bisa dibaca TrOCR; OCR dijalankan per batch oleh pemanggil
+        line_crops.append(Image.fromarray(roi_final))
 
+        if debug:
+            debug_crops.append((i, roi_final))
+    start = _add_time(timings, "crop", start)
+
+    for i, roi_final in debug_crops:
         cv2.imwrite(os.path.join(debug_dir, f"debug_crop_{i}.png"), roi_final)
+    if debug_crops:
+        _add_time(timings, "debug_write", start)
+
+    return line_crops
+
+def segment_and_ocr(image_input, debug_dir="debug_results", batch_size=OCR_BATCH_SIZE, debug=None):
+    """
+    Membaca gambar, meluruskan, membersihkan, melakukan segmentasi
+    berbasis kontur, dan menjalankan OCR semua baris dalam batch.
+    """
+    if isinstance(image_input, str):
+        color_image = cv2.imread(image_input)
+        if color_image is None: return "⚠️ Gambar tidak ditemukan."
+    else:
+        # Tidak perlu salinan: tidak ada tahap yang mengubah gambar input secara in-place
+        color_image = image_input
 
-    return "\n".join(final_text)
+    line_crops = extract_line_crops(color_image, debug_dir=debug_dir, debug=debug)
+    return "\n".join(ocr_lines(line_crops, batch_size=batch_size))
 
 
 
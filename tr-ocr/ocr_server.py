@@ -0,0 +1,173 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from ocr_processing import load_ocr_model
+from main import iter_pdf_pages, process_page
+
+# ========================================================================
+#  KONFIGURASI
+# ========================================================================
+OCR_SERVER_PORT = int(os.getenv("OCR_SERVER_PORT", "5556"))
+MAX_FILE_SIZE = 50 * 1024 * 1024
+# Jumlah job yang boleh menunggu di antrian sebelum upload baru ditolak (503)
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "100"))
+# Jumlah job selesai/gagal yang hasilnya tetap disimpan di memori
+OCR_JOB_RETENTION = int(os.getenv("OCR_JOB_RETENTION", "500"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_job_queue = queue.Queue(maxsize=OCR_MAX_PENDING)
+_model_ready = threading.Event()
+# Pesan error terakhir saat memuat model, ditampilkan di /health
+_model_error = None
+
+
+# ========================================================================
+#  JOB OCR
+# ========================================================================
+def _public_job(job):
+    return {key: value for key, value in job.items() if key != "pdf_bytes"}
+
+
+def _evict_finished_jobs():
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in (DONE, FAILED)]
+    for job_id in finished[:max(0, len(finished) - OCR_JOB_RETENTION)]:
+        del _jobs[job_id]
+
+
+def _ensure_model():
+    # Dipanggil ulang per job: kegagalan memuat model (unduhan, memori) bisa pulih tanpa restart
+    global _model_error
+    if _model_ready.is_set():
+        return
+    try:
+        load_ocr_model()
+    except Exception as e:
+        _model_error = str(e)
+        raise RuntimeError(f"Model TrOCR gagal dimuat: {e}")
+    _model_error = None
+    _model_ready.set()
+    print("[INFO] Model TrOCR siap")
+
+
+def _run_job(job_id):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["status"] = RUNNING
+        job["started_at"] = time.time()
+        pdf_bytes = job.pop("pdf_bytes")
+
+    try:
+        _ensure_model()
+        answers = []
+        pages = 0
+        for page_number, image in iter_pdf_pages(pdf_bytes):
+            # Teks per kotak jawaban, urut halaman lalu kotak
+            answers.extend(text.strip() for text in process_page(page_number, image))
+            pages = page_number
+        result = {"status": DONE, "pages": pages, "answers": answers, "text": "\n\n".join(answers)}
+        print(f"[INFO] Job {job_id} selesai: {pages} halaman, {len(answers)} kotak jawaban")
+    except Exception as e:
+        result = {"status": FAILED, "error": str(e)}
+        print(f"[ERROR] Job {job_id} gagal: {e}")
+
+    with _jobs_lock:
+        job.update(result)
+        job["finished_at"] = time.time()
+        job["duration"] = round(job["finished_at"] - job["started_at"], 2)
+        _evict_finished_jobs()
+
+
+def _job_worker():
+    # Satu worker: model TrOCR dimuat sekali dan dipakai bergantian oleh semua job.
+    # Gagal memuat tidak mematikan thread; job berikutnya mencoba lagi atau gagal dengan pesannya
+    try:
+        _ensure_model()
+    except Exception as e:
+        print(f"[ERROR] {e}")
+    print("[INFO] Worker OCR menunggu job")
+    while True:
+        job_id = _job_queue.get()
+        try:
+            _run_job(job_id)
+        finally:
+            _job_queue.task_done()
+
+
+# ========================================================================
+#  API
+# ========================================================================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=_job_worker, name="ocr-worker", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="GradeMind OCR Service", version="0.1", lifespan=lifespan)
+
+
+@app.post("/ocr", status_code=202)
+async def submit_ocr_job(file: UploadFile = File(...), owner: Optional[str] = Form(None)):
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Hanya file PDF yang diizinkan")
+
+    pdf_bytes = await file.read()
+    if len(pdf_bytes) > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Ukuran file melebihi batas 50MB ({len(pdf_bytes) / (1024*1024):.2f}MB)")
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "filename": file.filename,
+        # Pemilik job menurut backend; backend memeriksanya sebelum mengembalikan hasil
+        "owner": owner,
+        "status": PENDING,
+        "created_at": time.time(),
+        "pdf_bytes": pdf_bytes,
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+    try:
+        _job_queue.put_nowait(job_id)
+    except queue.Full:
+        with _jobs_lock:
+            del _jobs[job_id]
+        raise HTTPException(status_code=503, detail="Antrian OCR penuh, coba lagi nanti")
+
+    return {"job_id": job_id, "status": PENDING, "queue_size": _job_queue.qsize()}
+
+
+@app.get("/ocr/{job_id}")
+def get_ocr_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job OCR tidak ditemukan")
+        return _public_job(job)
+
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok",
+        "model_ready": _model_ready.is_set(),
+        "model_error": _model_error,
+        "queue_size": _job_queue.qsize(),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    print(f"[INFO] Menjalankan OCR service di http://localhost:{OCR_SERVER_PORT}")
+    uvicorn.run("ocr_server:app", host="0.0.0.0", port=OCR_SERVER_PORT, reload=False)